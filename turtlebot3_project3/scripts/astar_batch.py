@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Plan a file of start/goal queries on the competition map across a process pool
+
+Each line of the query file is a JSON object such as
+    {"id": "q1", "start": [500, 1000, 0], "goal": [5750, 1769], "params": {"rpm1": 25, "rpm2": 50}}
+with positions in the map frame (bottom left as origin). "id" and "params" are optional,
+"params" overrides the PlannerParams given on the command line for that query.
+Results are written as JSON Lines with the path, cost, search statistics and planning time of each query.
+All workers memory map the same distance field file, so the map is held in memory only once.
+"""
+
+import argparse
+import dataclasses
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import astar_map
+import astar_planner
+
+# Distance field memory mapped by each worker, and its collision maps per clearance
+_field = None
+_collision_maps = {}
+
+
+def _init_worker(field_path):
+    """Memory map the shared distance field once per worker"""
+    global _field
+    _field = np.load(field_path, mmap_mode='r')
+    _collision_maps.clear()
+
+
+def _collision_map(clearance):
+    """Collision maps share the memory mapped field, only the clearance changes"""
+    if clearance not in _collision_maps:
+        _collision_maps[clearance] = astar_map.CollisionMap.from_distance_field(_field, clearance)
+    return _collision_maps[clearance]
+
+
+def run_query(job):
+    """Plan one query, returns its JSON result"""
+
+    index, query, base_params = job
+    height = _field.shape[0]
+    record = {'id': query.get('id', index), 'start': query['start'], 'goal': query['goal']}
+
+    try:
+        params = dataclasses.replace(base_params, **query.get('params', {}))
+        # Convert the map frame positions to canvas coordinates, the canvas y axis points down so headings are mirrored
+        x_start, y_start, theta_start = query['start']
+        x_goal, y_goal = query['goal'][:2]
+        start = (x_start, astar_map.flip_y(y_start, height), -theta_start)
+        goal = (x_goal, astar_map.flip_y(y_goal, height))
+
+        begin = time.perf_counter()
+        result = astar_planner.plan(start, goal, params, _collision_map(params.clearance))
+        elapsed = time.perf_counter() - begin
+    except (KeyError, TypeError, ValueError) as e:
+        record['error'] = str(e)
+        return record
+
+    record.update({
+        'reached': result.reached,
+        'cost': result.cost if result.reached else None,
+        'expansions': result.stats.expansions,
+        'nodes': result.stats.nodes,
+        'time': elapsed,
+        'stats': result.stats.as_dict(),
+        # Path points back in the map frame
+        'path': [(float(x), float(astar_map.flip_y(y, height)), float(-theta), rpm_l, rpm_r)
+                 for x, y, theta, rpm_l, rpm_r in result.path],
+    })
+    return record
+
+
+def read_queries(path):
+    """Read the JSON Lines query file, skipping blank lines"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_batch(queries, params, output, workers=None):
+    """Plan the queries across a pool of workers, writing one JSON line per query as they finish"""
+
+    # Build the shared map once, workers memory map the cached file
+    field_path = astar_map.distance_field_path()
+    tmp_path = None
+    if field_path is None:
+        # No writable cache, share a temporary copy instead
+        fd, tmp_path = tempfile.mkstemp(suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, astar_map.load_distance_field(cache_dir=None))
+        field_path = tmp_path
+
+    jobs = [(index, query, params) for index, query in enumerate(queries)]
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(field_path,)) as pool:
+            for record in pool.imap_unordered(run_query, jobs):
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+    finally:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plan a batch of A* queries in parallel')
+    parser.add_argument('queries', help='JSON Lines file of queries')
+    parser.add_argument('-o', '--output', help='JSON Lines file of results, defaults to stdout')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of worker processes, defaults to the number of cores')
+    defaults = astar_planner.PlannerParams()
+    parser.add_argument('--rpm1', type=float, default=defaults.rpm1)
+    parser.add_argument('--rpm2', type=float, default=defaults.rpm2)
+    parser.add_argument('--T', type=float, default=defaults.T, help='duration of an action (s)')
+    parser.add_argument('--clearance', type=float, default=defaults.clearance, help='robot radius and clearance (mm)')
+    parser.add_argument('--distance-threshold', type=float, default=defaults.distance_threshold)
+    parser.add_argument('--angular-threshold', type=float, default=defaults.angular_threshold)
+    args = parser.parse_args()
+
+    params = astar_planner.PlannerParams(rpm1=args.rpm1, rpm2=args.rpm2, T=args.T, clearance=args.clearance,
+                                         distance_threshold=args.distance_threshold,
+                                         angular_threshold=args.angular_threshold)
+    queries = read_queries(args.queries)
+
+    begin = time.perf_counter()
+    if args.output:
+        with open(args.output, 'w') as output:
+            run_batch(queries, params, output, args.workers)
+    else:
+        run_batch(queries, params, sys.stdout, args.workers)
+    print(f'Planned {len(queries)} queries in {time.perf_counter()-begin:.2f} seconds', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Benchmark the A* planner on fixed scenarios of the competition map
+
+Every scenario is planned with the parameters of the ROS node and of the standalone script,
+reporting wall time, expansions per second, peak memory and path cost.
+The time, expansions, peak memory and cost are compared against a stored baseline, and the exit code is 1
+when any of them regresses beyond the tolerance, times also beyond an absolute slack as the shortest take a few
+milliseconds, when the compiled kernel plans differently from pure Python, or when a repair of the incremental
+planner differs from a fresh search. Timings depend on the machine, so refresh the baseline with --update-baseline when moving to another one, or when a change is meant
+to alter the results.
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import astar_corridor
+import astar_incremental
+import astar_map
+import astar_planner
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Start (x, y, theta) and goal (x, y) in the map frame (bottom left as origin)
+SCENARIOS = {
+    'short': ((500, 1000, 0), (1200, 1000)),
+    # Under the first wall and over the second one
+    'gaps': ((1000, 500, 0), (3200, 1500)),
+    # Around the circle, whose clearance closes the top of the map
+    'circle': ((3000, 1500, 0), (5300, 1500)),
+    # The competition query, across the whole map
+    'long': ((500, 1000, 0), (5750, 1769)),
+}
+
+# Parameters of the ROS node and of the standalone script with its sample inputs, and planner options
+CONFIGS = {
+    'ros': astar_planner.PlannerParams(),
+    'script': astar_planner.PlannerParams(T=0.4, distance_threshold=25, angular_threshold=25),
+    # The ROS node parameters with the obstacle aware heuristic
+    'dijkstra': astar_planner.PlannerParams(heuristic='dijkstra'),
+    # The ROS node parameters searching from both ends
+    'bidirectional': astar_planner.PlannerParams(bidirectional=True),
+    # The ROS node parameters inside a corridor planned on a coarse map
+    'hierarchical': astar_planner.PlannerParams(hierarchical=True),
+    # The ROS node parameters with the compiled expansion kernel, the same as 'ros' without Numba
+    'jit': astar_planner.PlannerParams(jit=True),
+    # The ROS node parameters with exact arcs checked every mm, as the node runs them
+    'arc': astar_planner.PlannerParams(jit=True, motion_model='arc'),
+    # As above, also trying an arc to the goal from every 10th expanded node, as the node does
+    'shot': astar_planner.PlannerParams(jit=True, motion_model='arc', shot_interval=10),
+    # The compiled kernel with actions lasting up to 8 times longer where the clearance allows
+    'adaptive': astar_planner.PlannerParams(jit=True, adaptive=True),
+}
+
+# Configurations with the compiled kernel, and the same parameters in pure Python, which must give the same plans
+JIT_PAIRS = {
+    'jit': (CONFIGS['jit'], CONFIGS['ros']),
+    'arc': (CONFIGS['arc'], dataclasses.replace(CONFIGS['arc'], jit=False)),
+}
+
+# Parameters of the incremental planner of the ROS node, for the replans, and width of its corridor around the
+# A* path (mm), twice the default replan distance of the node
+INCREMENTAL = CONFIGS['arc']
+INCREMENTAL_CORRIDOR = 600
+
+# Metrics compared against the baseline, and whether higher values are better. Expansions per second are only
+# reported, they follow the time
+METRICS = {'time': False, 'peak_memory': False, 'cost': False, 'expansions': False}
+
+
+def run_case(start, goal, params, repeat):
+    """Plan one scenario, returns its metrics"""
+
+    start = (start[0], astar_map.flip_y(start[1]), start[2])
+    goal = (goal[0], astar_map.flip_y(goal[1]))
+
+    # Keep map and lattice loading, and the compilation of the jit kernel, out of the timings
+    collision_map = astar_planner.default_collision_map(params.clearance)
+    astar_planner.plan(start, goal, params, collision_map)
+
+    # Best wall time of the repeats
+    times = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = astar_planner.plan(start, goal, params, collision_map)
+        times.append(time.perf_counter() - begin)
+
+    # Peak memory is measured in a separate run, as tracing slows the search down
+    tracemalloc.start()
+    astar_planner.plan(start, goal, params, collision_map)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(times)
+    return {
+        'reached': result.reached,
+        'time': best,
+        'expansions': result.stats.expansions,
+        'expansions_per_second': result.stats.expansions / best,
+        'peak_memory': peak,
+        'cost': result.cost if result.reached else None,
+    }
+
+
+def check_jit(start, goal):
+    """Plan a scenario with every pair of JIT_PAIRS, returns (config, compiled, pure Python) plan results per pair"""
+
+    start = (start[0], astar_map.flip_y(start[1]), start[2])
+    goal = (goal[0], astar_map.flip_y(goal[1]))
+    rows = []
+    for config, (compiled, python) in JIT_PAIRS.items():
+        collision_map = astar_planner.default_collision_map(compiled.clearance)
+        rows.append((config, astar_planner.plan(start, goal, compiled, collision_map),
+                     astar_planner.plan(start, goal, python, collision_map)))
+    return rows
+
+
+def check_incremental(start, goal, params):
+    """
+    Repair the incremental planner after an obstacle appears on its path, after the obstacle is removed and after
+    the start moves off the path, returns a (step, repaired, fresh) row of plan results per repair
+    As in the ROS node, the incremental planner searches a corridor around the path of the A* search
+    """
+
+    start = (start[0], astar_map.flip_y(start[1]), start[2])
+    goal = (goal[0], astar_map.flip_y(goal[1]))
+    collision_map = astar_planner.default_collision_map(params.clearance)
+    planned = astar_planner.plan(start, goal, params, collision_map)
+    if not planned.reached:
+        return [('astar', planned, planned)]
+    corridor = astar_corridor.Corridor.around_path(collision_map, planned.path, width=INCREMENTAL_CORRIDOR)
+    replanner = astar_incremental.IncrementalPlanner(collision_map, goal, params, corridor=corridor)
+    first = replanner.plan(start)
+    if not first.reached:
+        return [('first', first, first)]
+
+    # An obstacle on the middle of the path, small enough to leave room around it in the narrow passages
+    x, y = (int(round(v)) for v in first.path[len(first.path) // 2][:2])
+    grid = collision_map.grid.copy()
+    grid[max(0, y - 40):y + 40, max(0, x - 40):x + 40] = collision_map.threshold
+    blocked = astar_map.CollisionMap(grid, collision_map.threshold)
+
+    # Turned away from the path a quarter of the way along it, path points are bin centers so it is in free space
+    x, y, theta = first.path[len(first.path) // 4][:3]
+    moved = (x, y, theta + 60)
+
+    rows = []
+    for step, step_map, step_start in (('blocked', blocked, start), ('unblocked', collision_map, start),
+                                       ('moved', collision_map, moved)):
+        replanner.update_map(step_map)
+        repaired = replanner.plan(step_start)
+        fresh = astar_incremental.IncrementalPlanner(step_map, goal, params, corridor=corridor).plan(step_start)
+        rows.append((step, repaired, fresh))
+    return rows
+
+
+def compare(results, baseline, tolerance, cost_tolerance, time_slack):
+    """Return the regressions of the results against the baseline, times may also exceed it by time_slack (s)"""
+
+    regressions = []
+    for case, metrics in results.items():
+        if case not in baseline:
+            continue
+        base = baseline[case]
+        if base['reached'] and not metrics['reached']:
+            regressions.append(f'{case}: goal no longer reached')
+            continue
+        for metric, higher_is_better in METRICS.items():
+            value, reference = metrics.get(metric), base.get(metric)
+            if value is None or reference is None:
+                continue
+            allowed = cost_tolerance if metric == 'cost' else tolerance
+            # Timings of a few milliseconds vary by more than the tolerance from run to run
+            slack = time_slack if metric == 'time' else 0
+            if higher_is_better:
+                worse = value < reference * (1 - allowed)
+            else:
+                worse = value > reference * (1 + allowed) + slack
+            if worse:
+                regressions.append(f'{case}: {metric} {value:.6g} vs baseline {reference:.6g}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the A* planner against a stored baseline')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline JSON file')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative regression of time, expansions and memory')
+    parser.add_argument('--cost-tolerance', type=float, default=0.01, help='allowed relative regression of path cost')
+    parser.add_argument('--time-slack', type=float, default=0.05,
+                        help='allowed absolute regression of time (s) on top of the tolerance')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario, the best time is kept')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='run only these scenarios')
+    parser.add_argument('--config', action='append', choices=sorted(CONFIGS), help='run only these configurations')
+    parser.add_argument('--skip-jit', action='store_true',
+                        help='do not compare the plans of the compiled kernel with pure Python')
+    parser.add_argument('--skip-incremental', action='store_true',
+                        help='do not compare the repairs of the incremental planner with fresh searches')
+    args = parser.parse_args()
+
+    results = {}
+    print(f'{"case":<22}{"reached":>8}{"time (s)":>10}{"exp":>9}{"exp/s":>10}{"peak (MB)":>11}{"cost":>9}')
+    for scenario in args.scenario or SCENARIOS:
+        start, goal = SCENARIOS[scenario]
+        for config in args.config or CONFIGS:
+            case = f'{scenario}/{config}'
+            metrics = run_case(start, goal, CONFIGS[config], args.repeat)
+            results[case] = metrics
+            cost = f'{metrics["cost"]:.0f}' if metrics['reached'] else '-'
+            print(f'{case:<22}{str(metrics["reached"]):>8}{metrics["time"]:>10.3f}{metrics["expansions"]:>9}'
+                  f'{metrics["expansions_per_second"]:>10.0f}{metrics["peak_memory"]/1e6:>11.1f}{cost:>9}')
+
+    # The compiled kernel must plan exactly as pure Python, and the repairs must find paths as cheap as searches
+    # from scratch, they are not part of the baseline
+    mismatches = []
+    if not args.skip_jit:
+        print(f'\n{"jit":<22}{"same":>8}{"exp":>9}{"python exp":>11}{"cost":>9}{"python cost":>12}')
+        for scenario in args.scenario or SCENARIOS:
+            start, goal = SCENARIOS[scenario]
+            for config, compiled, python in check_jit(start, goal):
+                case = f'{scenario}/{config}'
+                same = ((compiled.reached, compiled.cost, compiled.stats.expansions, compiled.path)
+                        == (python.reached, python.cost, python.stats.expansions, python.path))
+                print(f'{case:<22}{str(same):>8}{compiled.stats.expansions:>9}'
+                      f'{python.stats.expansions:>11}{compiled.cost:>9.0f}{python.cost:>12.0f}')
+                if not same:
+                    mismatches.append(f'{case}: the compiled kernel plans differently from pure Python')
+    if not args.skip_incremental:
+        print(f'\n{"repair":<22}{"reached":>8}{"exp":>9}{"fresh exp":>11}{"cost":>9}{"fresh cost":>12}')
+        for scenario in args.scenario or SCENARIOS:
+            start, goal = SCENARIOS[scenario]
+            for step, repaired, fresh in check_incremental(start, goal, INCREMENTAL):
+                case = f'{scenario}/{step}'
+                print(f'{case:<22}{str(repaired.reached):>8}{repaired.stats.expansions:>9}'
+                      f'{fresh.stats.expansions:>11}{repaired.cost:>9.0f}{fresh.cost:>12.0f}')
+                if repaired.reached != fresh.reached or (fresh.reached and
+                                                         abs(repaired.cost - fresh.cost) > 1e-9 * fresh.cost):
+                    mismatches.append(f'{case}: cost {repaired.cost:.6g} after the repair vs {fresh.cost:.6g} fresh')
+        print()
+    if mismatches:
+        print('Plans differing from their reference:')
+        for mismatch in mismatches:
+            print(f'  {mismatch}')
+
+    if args.update_baseline:
+        baseline = {'machine': {'python': platform.python_version(), 'numpy': np.__version__,
+                                'processor': platform.processor() or platform.machine()},
+                    'results': results}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}')
+        if mismatches:
+            sys.exit(1)
+        return
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    except OSError:
+        print(f'No baseline at {args.baseline}, run with --update-baseline to create it')
+        if mismatches:
+            sys.exit(1)
+        return
+
+    regressions = compare(results, baseline, args.tolerance, args.cost_tolerance, args.time_slack)
+    if regressions:
+        print('Regressions against the baseline:')
+        for regression in regressions:
+            print(f'  {regression}')
+    if regressions or mismatches:
+        sys.exit(1)
+    print('No regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
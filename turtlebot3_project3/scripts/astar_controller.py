@@ -3,14 +3,22 @@
 import rclpy
 from rclpy.node import Node
 from geometry_msgs.msg import Twist 
-from nav_msgs.msg import Odometry
+from nav_msgs.msg import Odometry, Path
+from geometry_msgs.msg import PoseStamped
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 
 import numpy as np
 import cv2
-import heapq
-import time
+import threading
 from math import dist
 
+import astar_corridor
+import astar_incremental
+import astar_map
+import astar_plan_cache
+import astar_planner
+import astar_render
+
 class AStarController(Node):
     def __init__(self):
         super().__init__('astar_controller')
@@ -20,8 +28,32 @@ class AStarController(Node):
         # Define map parameters
         self.map_params()
 
-        # Start the A* path planning
-        self.astar()
+        # Publish the search statistics of every plan
+        self.diagnostics_pub = self.create_publisher(DiagnosticArray, '/diagnostics', 10)
+        # Publish every improved path of the anytime planner
+        self.path_pub = self.create_publisher(Path, '/astar/path', 10)
+
+        # Planning time budget of the anytime planner (s), 0 plans the optimal path without a budget
+        self.planning_time = self.declare_parameter('planning_time', 5.0).value
+        # Distance from the tracked point that triggers a replan from the robot pose (m), 0 never replans
+        self.replan_distance = self.declare_parameter('replan_distance', 0.3).value
+        # Expansions of the incremental planner per replan, a longer search resumes at the next replan
+        self.replan_expansions = self.declare_parameter('replan_expansions', 3000).value
+
+        # Show the explored nodes and the path in a window after every plan
+        self.visualize = self.declare_parameter('visualize', False).value
+
+        # Plans of this map from earlier launches
+        self.plan_cache = astar_plan_cache.PlanCache(astar_map.map_key(None, self.width, self.height))
+
+        # Define the start position and the planner parameters
+        self.positions()
+
+        # Planning runs in a background job, so odometry and the controller keep running meanwhile
+        # The lock guards the path and the job, which are shared with the executor
+        self.lock = threading.Lock()
+        self.worker = None
+        self.cancel = None
 
         # Counter to publish path inputs
         self.i = 0
@@ -29,10 +61,14 @@ class AStarController(Node):
         self.counter = 0
         self.reached = False
         # self.x_start, self.y_start, self.theta_start = 500, int(2000/2), 0
+        # Robot pose in the odom frame, which starts at the spawn position
+        self.x, self.y, self.yaw = 0.0, 0.0, 0.0
 
         # Create Subscribers
         # Subscribe to /odom topic
         self.odom_sub = self.create_subscription(Odometry, '/odom', self.odom_callback, 10)   
+        # Subscribe to goals in the odom frame, a new goal cancels and replaces the one being planned
+        self.goal_sub = self.create_subscription(PoseStamped, '/goal_pose', self.goal_callback, 10)
 
         # Create Publishers
         # Publish to /cmd_vel topic
@@ -42,6 +78,10 @@ class AStarController(Node):
         # Timer for publishing to /cmd_vel
         self.controller = self.create_timer(0.1, self.controller)
 
+        # Ask for a goal on the terminal, without blocking the node
+        if self.declare_parameter('prompt_goal', True).value:
+            threading.Thread(target=self.prompt_goal, daemon=True).start()
+
     def robot_params(self):
         """Define robot parameters"""
         # Define the robot parameters
@@ -57,69 +97,22 @@ class AStarController(Node):
         print("Generating map...")
 
         # Define map parameters
-        self.width = 6000 #mm
-        self.height = 2000 #mm
+        self.width = astar_map.WIDTH #mm
+        self.height = astar_map.HEIGHT #mm
         self.scale = 5
 
-        clearance_color = (0, 255, 255)
-        obstacle_color = (0, 0, 0)
-        white = (255, 255, 255)
-
-        # Create a black canvas
-        self.canvas = np.zeros((self.height, self.width, 3), dtype="uint8")
-        # Create a white rectangle
-        self.canvas = cv2.rectangle(self.canvas, (self.clearance, self.clearance),
-                                   (self.width-self.clearance, self.height-self.clearance), white, -1)
-
-        # OBSTACLE 1
-        x1, x2 = 1500, 1750
-        y1, y2 = 0, 1000
-        # Draw the clearance
-        for i in range(x1-self.clearance, x2+self.clearance):
-            for j in range(y1+self.clearance, y2+self.clearance):
-                self.canvas[j, i] = clearance_color
-        # Draw the obstacle
-        for i in range(x1, x2):
-            for j in range(y1, y2):
-                self.canvas[j, i] = obstacle_color
-        
-        # OBSTACLE 2
-        x1, x2 = 2500, 2750
-        y1, y2 = self.height-1000, self.height
-        # Draw the clearance
-        for i in range(x1-self.clearance, x2+self.clearance):
-            for j in range(y1-self.clearance, y2-self.clearance+1):
-                self.canvas[j, i] = clearance_color
-        # Draw the obstacle
-        for i in range(x1, x2):
-            for j in range(y1, y2):
-                self.canvas[j, i] = obstacle_color
-
-        x_center, y_center = 4200, 800
-        radius = 600
-        # Draw the clearance
-        for i in range(x_center-radius-self.clearance, x_center+radius+self.clearance):
-            for j in range(y_center-radius-self.clearance, y_center+radius+self.clearance):
-                if (i-x_center)**2 + (j-y_center)**2 <= (radius+self.clearance)**2 and self.canvas[j, i, 0] != 0:
-                    self.canvas[j, i] = clearance_color
-        # Draw the obstacle
-        for i in range(x_center-radius, x_center+radius):
-            for j in range(y_center-radius, y_center+radius):
-                if (i-x_center)**2 + (j-y_center)**2 <= radius**2:
-                    self.canvas[j, i] = obstacle_color
-
-    def astar(self):
-
-        # Get the class parameters
-        WHEEL_RADIUS = self.WHEEL_RADIUS
-        WHEEL_DISTANCE = self.WHEEL_DISTANCE
+        # Free space of the clearance, memory mapped from the on-disk cache so planner processes share it
+        self.collision_map = astar_map.CollisionMap.from_occupancy(
+            astar_map.load_occupancy(self.clearance, self.width, self.height))
+        # The coloured map is only built when visualizing
+        self.canvas = None
+
+    def get_goal(self):
+        """Get the goal position from the user, in canvas coordinates"""
+
         clearance = self.clearance
-        canvas = self.canvas
         width, height = self.width, self.height
 
-        # Define the start and goal positions
-        x_start, y_start, theta_start = 500, int(height/2), 0
-
         print("Enter goal positions with respect to bottom left corner of provided map.")
 
         # Get the goal positions from the user
@@ -129,265 +122,251 @@ class AStarController(Node):
 
             y_goal = height-y_goal-1
             try:
-                if canvas[y_goal, x_goal, 0] == 255 and (width-250 <= x_goal and x_goal <= width-clearance-1):
+                if self.collision_map.is_free(x_goal, y_goal) and (width-250 <= x_goal and x_goal <= width-clearance-1):
                     break
             except:
                 print('Invalid input, re-enter the goal node position')
             else:
                 print('Invalid input, re-enter the goal node position')
 
-        print("Positions accepted! Calculating path...")
+        return x_goal, y_goal
 
-        self.x_start, self.y_start, self.theta_start = x_start, y_start, theta_start
-        self.x_goal, self.y_goal = x_goal, y_goal
+    def positions(self):
+        """Define the start position and the planner parameters"""
 
-        distance_threshold = 20 #mm
-        angular_threshold = 30  #deg  
-        rpm1, rpm2 = 50, 100 #rpm
+        # Define the start position, goals come from the terminal or the goal topic
+        x_start, y_start, theta_start = 500, int(self.height/2), 0
 
-        # Define action set
-        action_set = [(0, rpm1), (rpm1, 0), (rpm1, rpm1), (0, rpm2), 
-                      (rpm2, 0), (rpm2, rpm2), (rpm1, rpm2), (rpm2, rpm1)]
+        self.x_start, self.y_start, self.theta_start = x_start, y_start, theta_start
+        self.x_goal, self.y_goal = None, None
+
+        self.T = 0.3 #s
+        self.params = astar_planner.PlannerParams(rpm1=50, rpm2=100, T=self.T, clearance=self.clearance,
+                                                  distance_threshold=20, angular_threshold=30,
+                                                  wheel_radius=self.WHEEL_RADIUS, wheel_distance=self.WHEEL_DISTANCE,
+                                                  # Compiled expansion kernel, when Numba is installed
+                                                  jit=True,
+                                                  # The robot drives the exact arcs of the wheel speeds
+                                                  motion_model='arc',
+                                                  # Try an arc to the goal from every 10th expanded node
+                                                  shot_interval=10)
 
-        # Make a lambda function to adjust the value of x to the visited space
-        adjust = lambda x, threshold: int(int(round(x*2)/2)/threshold)
+        self.path = []
+        self.path_length = 0
+        # Incremental planner for the replans, built on the first replan of a goal
+        self.replanner = None
+
+    def prompt_goal(self):
+        """Read a goal from the terminal and plan to it"""
+        x_goal, y_goal = self.get_goal()
+        print("Positions accepted!")
+        self.set_goal(x_goal, y_goal)
+
+    def goal_callback(self, msg):
+        """Plan to a goal received in the odom frame (m)"""
+
+        x_goal, y_goal = (int(round(v)) for v in self.odom_to_canvas(msg.pose.position.x, msg.pose.position.y))
+        if not self.collision_map.is_free(x_goal, y_goal):
+            self.get_logger().warn(f'Goal ({msg.pose.position.x:.3f}, {msg.pose.position.y:.3f}) is not in free space')
+            return
+        self.set_goal(x_goal, y_goal)
+
+    def set_goal(self, x_goal, y_goal):
+        """Plan from the robot pose to a new goal in canvas coordinates, replacing the plan in flight"""
+
+        with self.lock:
+            self.x_goal, self.y_goal = x_goal, y_goal
+            # Replans are incremental per goal
+            self.replanner = None
+            self.start_job(self.astar, self.robot_pose(), (x_goal, y_goal))
+
+    def odom_to_canvas(self, x, y):
+        """Point of the odom frame in meters to canvas coordinates in mm"""
+        # Inverse of the transform of the controller
+        return self.x_start + x*1000, self.y_start - y*1000
+
+    def robot_pose(self):
+        """Robot pose (x, y, theta) in canvas coordinates"""
+        # The canvas y axis points down, so headings are mirrored
+        return (*self.odom_to_canvas(self.x, self.y), -self.yaw)
+
+    def start_job(self, target, *args):
+        """Run a planning job in a background thread, cancelling the one in flight. Call with the lock held"""
+
+        # The cancelled job stops at its next expansion and drops its result, no need to wait for it
+        if self.cancel is not None:
+            self.cancel.set()
+        self.cancel = threading.Event()
+        self.worker = threading.Thread(target=target, args=(*args, self.cancel), daemon=True)
+        self.worker.start()
+
+    def planning_budget(self):
+        """Time budget of the anytime planner (s), None when planning the optimal path"""
+        return self.planning_time if self.planning_time > 0 else None
+
+    def load_cached_plan(self, start, goal, cancel):
+        """Follow the path of an earlier plan with the same map, parameters, start and goal, returns True on a hit"""
+
+        result = self.plan_cache.get(self.params, start, goal, self.planning_budget())
+        if result is None:
+            return False
+        self.get_logger().info('Loaded the path from the plan cache')
+        self.publish_path(result, cancel)
+        return True
+
+    def astar(self, start, goal, cancel):
+
+        params = self.params
+
+        # Load the path from the plan cache, or start the A* path planning
+        if self.load_cached_plan(start, goal, cancel):
+            return
+
+        print("Calculating path...")
 
         ########## IMPLEMENT A* SEARCH ALGORITHM ##########
 
-        q = []
-        heapq.heappush(q, (0, x_start, y_start, theta_start))
-
-        # Dictionary to store visited nodes
-        visited = {(adjust(x_start, distance_threshold),
-                    adjust(y_start, distance_threshold),
-                    adjust(theta_start, angular_threshold)): 1}
-
-        # Dictionary to store the parent of each node
-        parent = {(x_start, y_start, theta_start): (x_start, y_start, theta_start)}
+        def on_path(result):
+            self.publish_path(result, cancel)
 
-        # Dictionary to store the cost to come of each node
-        cost_to_come = {(adjust(x_start, distance_threshold),
-                        adjust(y_start, distance_threshold),
-                        adjust(theta_start, angular_threshold)): 0}
-
-        # Dictionary to store the cost of each node
-        cost = {(adjust(x_start, distance_threshold),
-                adjust(y_start, distance_threshold),
-                adjust(theta_start, angular_threshold)): 0}
-        
-        # Dictionary to store the inputs applied to that node
-        inputs = {(x_start, y_start, theta_start): (0, 0)}
-
-        reached = False
-        start = time.time()
-
-        while q:
-
-            _, x, y, theta = heapq.heappop(q)
-            x_achieved, y_achieved, theta_achieved = x, y, theta
-
-            # Get the cost to come of the current node
-            c2c = cost_to_come[(adjust(x, distance_threshold),
-                                adjust(y, distance_threshold),
-                                adjust(theta, angular_threshold))]
-            
-            if dist((x, y), (x_goal, y_goal)) < 10:
-                end = time.time()
-                print("Goal reached")
-                # Print time in minutes and seconds
-                print("Time taken: ", int((end-start)/60), "minutes", int((end-start)%60), "seconds")
-                # print("Goal reached: ", end-start, "seconds")
-                reached = True
-                x_achieved, y_achieved, theta_achieved = x, y, theta
-                break
-
-            for rpm_l, rpm_r in action_set:
-
-                # Convert the rpm values to angular velocity
-                ul = 2 * np.pi * rpm_l / 60
-                ur = 2 * np.pi * rpm_r / 60
-
-                # Apply these velocities for t seconds to the model
-                t = 0
-                dt = 0.1
-                d = 0
-                self.T = 0.3
-                x_new, y_new, theta_new = x, y, theta
-                while t < self.T:
-                    dx_dt = WHEEL_RADIUS/2 * (ul + ur) * np.cos(np.radians(theta_new))
-                    dy_dt = WHEEL_RADIUS/2 * (ul + ur) * np.sin(np.radians(theta_new))
-                    dtheta_dt = np.rad2deg(WHEEL_RADIUS/WHEEL_DISTANCE * (ur - ul))
-
-                    # Save the current state
-                    x_prev, y_prev, theta_prev = x_new, y_new, theta_new
-
-                    # Get the new state
-                    x_new += dx_dt * dt
-                    y_new += dy_dt * dt
-                    theta_new += dtheta_dt * dt 
-
-                    # Check if the new state is in the obstacle space
-                    if canvas[int(round(y_new*2)/2), int(round(x_new*2)/2), 0] == 255:
-                        # Calculate the total distance travelled
-                        d += np.sqrt( (dx_dt*dt)**2 + (dy_dt*dt)**2)
-                        t += dt 
-                    # If the new state is in the obstacle space, revert to the previous state
-                    else:
-                        x_new, y_new, theta_new = x_prev, y_prev, theta_prev
-                        break
-
-                # Let the action cost be a function of distance travelled
-                action_cost = int(d)
-
-                # Keep the theta_newing angle within 180 and -180
-                if theta_new > 180:
-                    theta_new -= 360
-                elif theta_new < -180:
-                    theta_new += 360
-
-                # Cap the new node values within the boundaries of the canvas
-                x_new = max(clearance, min(width-clearance, x_new))
-                y_new = max(clearance, min(height-clearance, y_new))
-
-                # Adjust the values for the canvas
-                x_cvs = int(round(x_new*2)/2)
-                y_cvs = int(round(y_new*2)/2)
-                theta_cvs = int(round(theta_new*2)/2)
-
-                # Adjust the values for the visited dictionary
-                x_vis = adjust(x_new, distance_threshold)
-                y_vis = adjust(y_new, distance_threshold)
-                theta_vis = adjust(theta_cvs, angular_threshold)
-
-                # Check if the new node is within the boundaries of the canvas
-                if 0 <= x_new < width and 0 <= y_new < height and canvas[y_cvs, x_cvs, 0] == 255:
-
-                    # Check if the new node is not visited
-                    if (x_vis, y_vis, theta_vis) not in visited:
-                        # Store the parent of the node
-                        parent[(x_new, y_new, theta_new)] = (x, y, theta)
-                        # Store the cost to come of the node
-                        cost_to_come[(x_vis, y_vis, theta_vis)] = c2c + action_cost
-                        # Store the cost of the node
-                        cost[(x_vis, y_vis, theta_vis)] = cost_to_come[(x_vis, y_vis, theta_vis)] + dist((x_new, y_new), (x_goal, y_goal))
-                        # Push the node into the priority queue
-                        heapq.heappush(q, (cost[(x_vis, y_vis, theta_vis)], x_new, y_new, theta_new))
-                        # Mark the node as visited
-                        visited[(x_vis, y_vis, theta_vis)] = 1
-                        # Store the inputs applied to that node
-                        inputs[(x_new, y_new, theta_new)] = (rpm_l, rpm_r)
-
-                    # If the node is visited, check if the new cost is less than the previous cost
-                    elif cost_to_come[(x_vis, y_vis, theta_vis)] > c2c + action_cost: 
-                        parent[(x_new, y_new, theta_new)] = (x, y, theta)
-                        cost_to_come[(x_vis, y_vis, theta_vis)] = c2c + action_cost 
-                        cost[x_vis, y_vis, theta_vis] = cost_to_come[(x_vis, y_vis, theta_vis)] + dist((x_new, y_new), (x_goal, y_goal))
-                        # Store the inputs applied to that node
-                        inputs[(x_new, y_new, theta_new)] = (rpm_l, rpm_r)
-
-        if not reached:
-            print('Goal could not be reached')
-            print("Exiting...")
-            exit()
-
-        ########## OPTIMAL PATH ##########
-        # Get the path from the parent dictionary
-        self.path = []
-        # x, y = x_goal, y_goal   
-        x, y, theta = x_achieved, y_achieved, theta_achieved
-        while (x, y, theta) != (x_start, y_start, theta_start):
-            # print(x, y)
-            rpm_l, rpm_r = inputs[(x, y, theta)]
-            self.path.append((x, y, theta, rpm_l, rpm_r))
-            x, y, theta = parent[(x, y, theta)]
-        rpm_l, rpm_r = inputs[(x, y, theta)]
-        self.path.append((x, y, theta, rpm_l, rpm_r))
-        self.path.reverse()
-
-        self.path_length = len(self.path)
-        # print(self.path)
+        # Record the edges of the search only to draw them
+        edges = astar_planner.EdgeBuffer() if self.visualize else None
+        try:
+            if self.planning_time > 0:
+                # Start with an inflated heuristic and keep improving the path until the budget is spent
+                result = astar_planner.plan_anytime(start, goal, self.planning_time, params, self.collision_map,
+                                                    on_path=on_path, cancel=cancel, edges=edges)
+            else:
+                result = astar_planner.plan(start, goal, params, self.collision_map, cancel=cancel, edges=edges)
+                if result.reached:
+                    on_path(result)
+        except ValueError as e:
+            self.get_logger().error(str(e))
+            return
+
+        if cancel.is_set():
+            self.get_logger().info('Planning cancelled by a new goal')
+            return
+
+        self.publish_stats(result)
+        if not result.reached:
+            # Keep the node alive, the controller holds the robot still without a path
+            self.get_logger().error('Goal could not be reached')
+            return
+
+        print("Goal reached")
+        # Print time in minutes and seconds
+        print("Time taken: ", int(result.stats.time/60), "minutes", int(result.stats.time%60), "seconds")
+        self.plan_cache.put(params, start, goal, result, self.planning_budget())
 
         # Visualize the path
-        self.visualize_path(parent, action_set)
-
-    def visualize_path(self, parent, action_set):
-
-        # Get the class parameters
-        canvas = self.canvas
-        x_start, y_start = self.x_start, self.y_start
+        if self.visualize:
+            self.visualize_path(edges, result.path)
+
+    def publish_path(self, result, cancel):
+        """Follow an improved path and publish it on /astar/path in the odom frame, unless its job was cancelled"""
+
+        with self.lock:
+            if cancel.is_set():
+                return
+            ########## OPTIMAL PATH ##########
+            self.path = result.path
+            self.path_length = len(self.path)
+            # Resume from the path point closest to the robot, the robot may have moved along an earlier path
+            x, y, _ = self.robot_pose()
+            self.i = min(range(self.path_length), key=lambda i: dist((x, y), self.path[i][:2]))
+        self.get_logger().info(f'Path of cost {result.cost:.0f} found with weight {result.weight}')
+
+        msg = Path()
+        msg.header.frame_id = 'odom'
+        msg.header.stamp = self.get_clock().now().to_msg()
+        for x, y, theta, _, _ in result.path:
+            pose = PoseStamped()
+            pose.header = msg.header
+            # Same transform as the controller, canvas coordinates in mm to the odom frame in meters
+            pose.pose.position.x = (x - self.x_start) / 1000
+            pose.pose.position.y = (self.y_start - y) / 1000
+            # The canvas y axis points down, so headings are mirrored
+            yaw = -np.radians(theta)
+            pose.pose.orientation.z = np.sin(yaw/2)
+            pose.pose.orientation.w = np.cos(yaw/2)
+            msg.poses.append(pose)
+        self.path_pub.publish(msg)
+
+    def replan(self, start, cancel):
+        """Plan from the robot pose with the incremental planner and follow the new path"""
+
+        with self.lock:
+            if self.replanner is None:
+                # Search around the path being followed, wide enough for the pose that drifted off it
+                corridor = astar_corridor.Corridor.around_path(self.collision_map, self.path,
+                                                               width=2000*self.replan_distance)
+                self.replanner = astar_incremental.IncrementalPlanner(self.collision_map, (self.x_goal, self.y_goal),
+                                                                      self.params, corridor=corridor)
+            replanner = self.replanner
+        result = replanner.plan(start, cancel, self.replan_expansions)
+        if cancel.is_set():
+            return
+        self.publish_stats(result)
+        if not result.reached:
+            self.get_logger().warn('Replanning from the robot pose did not find a path yet, keeping the current path')
+            return
+
+        self.get_logger().info(f'Replanned from the robot pose in {result.stats.time:.3f} s')
+        self.publish_path(result, cancel)
+
+    def publish_stats(self, result):
+        """Log the search statistics of a plan and publish them on /diagnostics"""
+
+        stats = result.stats.as_dict()
+        self.get_logger().info('A* search: ' + ', '.join(f'{name}={value:.4g}' for name, value in stats.items()))
+
+        status = DiagnosticStatus()
+        status.name = 'astar_controller: A* search'
+        status.hardware_id = 'astar_planner'
+        status.level = DiagnosticStatus.OK if result.reached else DiagnosticStatus.WARN
+        status.message = 'Goal reached' if result.reached else 'Goal could not be reached'
+        status.values = [KeyValue(key=name, value=str(value)) for name, value in stats.items()]
+
+        msg = DiagnosticArray()
+        msg.header.stamp = self.get_clock().now().to_msg()
+        msg.status = [status]
+        self.diagnostics_pub.publish(msg)
+
+    def visualize_path(self, edges, path):
+
+        # Draw on frames at the display resolution, every plan starts from a clean map
+        if self.canvas is None:
+            self.canvas = astar_map.canvas_from_distance_field(
+                astar_map.load_distance_field(self.width, self.height), self.clearance)
+        renderer = astar_render.Renderer(self.canvas, self.scale)
+        x_start, y_start = path[0][0], path[0][1]
         x_goal, y_goal = self.x_goal, self.y_goal
-        WHEEL_RADIUS = self.WHEEL_RADIUS
-        WHEEL_DISTANCE = self.WHEEL_DISTANCE
-        path = self.path
-        T = self.T
-        width_resized, height_resized = int(self.width/self.scale), int(self.height/self.scale)
+        params = self.params
 
         # Draw the start and goal nodes on the canvas
-        cv2.circle(canvas, (x_start, y_start), 10, (0, 255, 0), 20)
-        cv2.circle(canvas, (x_goal, y_goal), 10, (0, 165, 255), 20)
+        renderer.circle((x_start, y_start), 10, (0, 255, 0), 20)
+        renderer.circle((x_goal, y_goal), 10, (0, 165, 255), 20)
 
-        # Draw on every threshold frame
+        # Draw on every threshold edges
         threshold = 200
-        counter = 0
-
-        # Draw the visited nodes on the canvas as a curve going from the parent to the child
-        for x, y, theta in parent:
-            counter += 1
-            # Plot this point on the canvas
-            # cv2.circle(canvas, (int(x), int(y)), 1, (255, 0, 0), 5)
-            # Plot the curve from the parent to the child
-            for rpm_l, rpm_r in action_set:
-                ul = 2 * np.pi * rpm_l / 60
-                ur = 2 * np.pi * rpm_r / 60
-                # Apply these velocities for T seconds to the model
-                t = 0
-                dt = 0.1
-                d = 0
-                x_new, y_new, theta_new = x, y, theta
-                x_parent, y_parent = x, y
-                while t < T:
-                    dx_dt = WHEEL_RADIUS/2 * (ul + ur) * np.cos(np.radians(theta_new))
-                    dy_dt = WHEEL_RADIUS/2 * (ul + ur) * np.sin(np.radians(theta_new))
-                    dtheta_dt = np.rad2deg(WHEEL_RADIUS/WHEEL_DISTANCE * (ur - ul))
-                    
-                    # Get the new state
-                    x_new += dx_dt * dt
-                    y_new += dy_dt * dt
-                    theta_new += dtheta_dt * dt 
-                    # Plot this point on the canvas
-                    x_cvs = int(x_new)
-                    y_cvs = int(y_new)
-                    # if clearance <= x_new < width-clearance-1 and clearance <= y_new < height-clearance-1 and canvas[y_cvs, x_cvs, 0] == 255:
-                    if canvas[y_cvs, x_cvs, 0] == 255:
-                        cv2.line(canvas, (int(x_parent), int(y_parent)), (x_cvs, y_cvs), (254, 0, 0), 5)
-                        # cv2.circle(canvas, (int(x_cvs), int(y_cvs)), 1, (255, 0, 0), 10)
-                        x_parent, y_parent = x_new, y_new
-                        t += dt 
-                    else:
-                        break
-
-            if(counter == threshold):
-                # Resize the canvas by a factor of scale
-                canvas_resized = cv2.resize(canvas, (width_resized, height_resized))
-                cv2.imshow('Canvas', canvas_resized)
-                # cv2.imshow('Canvas', canvas)
-                cv2.waitKey(1)  
-                counter = 0
-            
+
+        # Draw the edges created by the search, their arcs are looked up in the motion lattice
+        lattice = astar_planner.load_adaptive_lattice(params)
+        polylines = astar_render.edge_polylines(edges, lattice)
+        for i in range(0, len(polylines), threshold):
+            renderer.edges(polylines[i:i+threshold])
+            cv2.imshow('Canvas', renderer.frame)
+            cv2.waitKey(1)
+
         # Draw the start and goal nodes on the canvas
-        cv2.circle(canvas, (x_start, y_start), 10, (0, 255, 0), 20)
-        cv2.circle(canvas, (x_goal, y_goal), 10, (0, 165, 255), 20)
+        renderer.circle((x_start, y_start), 10, (0, 255, 0), 20)
+        renderer.circle((x_goal, y_goal), 10, (0, 165, 255), 20)
 
         # Draw the path on the canvas
-        for i in range(len(path)-1):
-            # Draw a line connecting the path points
-            cv2.line(canvas, (int(path[i][0]), int(path[i][1])), (int(path[i+1][0]), int(path[i+1][1])), (0, 0, 255), 10)
-            # Resize the canvas by a factor of scale
-            canvas_resized = cv2.resize(canvas, (width_resized, height_resized))
-            cv2.imshow('Canvas', canvas_resized)
-            # cv2.imshow('Canvas', canvas)
-
-        # Release VideoWriter
+        renderer.path(path)
+        cv2.imshow('Canvas', renderer.frame)
+
         cv2.waitKey(0)
         cv2.destroyAllWindows()
 
@@ -430,9 +409,12 @@ class AStarController(Node):
 
     def controller(self):
 
-        if self.i < self.path_length:
+        with self.lock:
+            tracking = self.i < self.path_length
+            if tracking:
+                x_, y_, theta_, rpm_l, rpm_r = self.path[self.i]
 
-            x_, y_, theta_, rpm_l, rpm_r = self.path[self.i]
+        if tracking:
 
             # Transform the coordinates to the robot frame and convert to meters
             x_ = (x_ - self.x_start) / 1000
@@ -447,6 +429,12 @@ class AStarController(Node):
             # Calculate the position error
             distance_error = np.sqrt((self.x-x_)**2 + (self.y-y_)**2)
 
+            # The robot drifted off the path, plan again from where it is unless a plan is already running
+            if self.replan_distance > 0 and distance_error > self.replan_distance:
+                with self.lock:
+                    if not self.worker.is_alive():
+                        self.start_job(self.replan, self.robot_pose())
+
             # Cap the distance error to 1, to avoid high linear velocities
             distance_error = min(1, distance_error)
 
@@ -470,7 +458,8 @@ class AStarController(Node):
             print("\n")
             
             if dist((self.x, self.y), (x_, y_)) < 0.1:
-                self.i += 1
+                with self.lock:
+                    self.i += 1
 
         else:
             # Stop the robot
@@ -0,0 +1,124 @@
+"""Coarse to fine planning, a grid A* on a downscaled map finds a corridor the lattice search is restricted to"""
+
+import heapq
+from math import dist, sqrt
+
+import numpy as np
+import cv2
+
+from astar_heuristic import MOVES, coarse_free_map
+
+
+def grid_astar(free, start_cell, goal_cell):
+    """Shortest 8 connected path of (row, col) cells from start_cell to goal_cell, None when there is none"""
+
+    ny, nx = free.shape
+    free_list = free.tolist()
+    goal_row, goal_col = goal_cell
+
+    def heuristic(row, col):
+        # Octile distance, exact on an empty grid
+        drow, dcol = abs(row - goal_row), abs(col - goal_col)
+        return max(drow, dcol) + (sqrt(2) - 1) * min(drow, dcol)
+
+    cost_to_come = {start_cell: 0}
+    parent = {start_cell: None}
+    # Ties go to the node with the higher cost to come, the one closer to the goal
+    q = [(heuristic(*start_cell), 0, start_cell)]
+
+    while q:
+        _, neg_c2c, cell = heapq.heappop(q)
+        c2c = -neg_c2c
+        if c2c > cost_to_come[cell]:
+            continue
+        if cell == goal_cell:
+            path = []
+            while cell is not None:
+                path.append(cell)
+                cell = parent[cell]
+            path.reverse()
+            return path
+
+        row, col = cell
+        for drow, dcol, cost in MOVES:
+            r, c = row + drow, col + dcol
+            if 0 <= r < ny and 0 <= c < nx and free_list[r][c]:
+                new_c2c = c2c + cost
+                if new_c2c < cost_to_come.get((r, c), np.inf):
+                    cost_to_come[(r, c)] = new_c2c
+                    parent[(r, c)] = cell
+                    heapq.heappush(q, (new_c2c + heuristic(r, c), -new_c2c, (r, c)))
+
+    return None
+
+
+class Corridor:
+    """
+    Cells of a downscaled map within width (mm) of a grid A* path from start to goal
+    A coarse cell is free only when all of its pixels are free, so the corridor follows space the robot fits in
+    """
+
+    def __init__(self, collision_map, start, goal, scale=5, width=400):
+        self.scale = scale
+        free = coarse_free_map(collision_map, scale, any_free=False)
+        start_cell = (int(start[1]) // scale, int(start[0]) // scale)
+        goal_cell = (int(goal[1]) // scale, int(goal[0]) // scale)
+        # Start and goal are free, even when their cells touch the clearance
+        free[start_cell] = free[goal_cell] = True
+
+        self.cells = grid_astar(free, start_cell, goal_cell)
+        self._inflate(free.shape, width)
+
+    @classmethod
+    def around_path(cls, collision_map, path, scale=5, width=400):
+        """Corridor within width (mm) of a planned path of (x, y, ...) points"""
+        corridor = cls.__new__(cls)
+        corridor.scale = scale
+        shape = (-(-collision_map.height // scale), -(-collision_map.width // scale))
+        corridor.cells = [(int(point[1]) // scale, int(point[0]) // scale) for point in path] or None
+        corridor._inflate(shape, width)
+        return corridor
+
+    def _inflate(self, shape, width):
+        """Mask of the cells within width (mm) of the path cells"""
+        scale = self.scale
+        self.mask = np.zeros(shape, dtype=np.uint8)
+        if self.cells is None:
+            return
+        rows, cols = np.array(self.cells).T
+        self.mask[rows, cols] = 1
+        # Inflate the path by the corridor width
+        radius = max(1, int(round(width / scale)))
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*radius+1, 2*radius+1))
+        self.mask = cv2.dilate(self.mask, kernel)
+        self._rows = self.mask.astype(bool).tolist()
+
+    @property
+    def found(self):
+        return self.cells is not None
+
+    def bounds(self):
+        """Bounding box (x_min, y_min, x_max, y_max) of the corridor in canvas coordinates"""
+        rows, cols = np.nonzero(self.mask)
+        scale = self.scale
+        return (int(cols.min()) * scale, int(rows.min()) * scale,
+                (int(cols.max()) + 1) * scale, (int(rows.max()) + 1) * scale)
+
+    def length(self):
+        """Length of the grid path (mm)"""
+        return self.scale * sum(dist(a, b) for a, b in zip(self.cells, self.cells[1:]))
+
+    def contains(self, x, y):
+        """Check if (x, y) in canvas coordinates is inside the corridor"""
+        scale = self.scale
+        return self._rows[int(y) // scale][int(x) // scale]
+
+    def restrict(self, heuristic):
+        """Wrap a heuristic so states outside the corridor are pruned (inf)"""
+        rows, scale = self._rows, self.scale
+
+        def corridor_heuristic(x, y):
+            if not rows[int(y) // scale][int(x) // scale]:
+                return np.inf
+            return heuristic(x, y)
+        return corridor_heuristic
@@ -0,0 +1,125 @@
+"""Obstacle aware heuristic for the A* planners, a grid Dijkstra from the goal over a coarse free space map"""
+
+import heapq
+from math import dist, inf, sqrt
+
+import numpy as np
+
+# Moves between coarse cells, (row, col, cost in cells)
+MOVES = ((0, 1, 1), (0, -1, 1), (1, 0, 1), (-1, 0, 1),
+         (1, 1, sqrt(2)), (1, -1, sqrt(2)), (-1, 1, sqrt(2)), (-1, -1, sqrt(2)))
+
+
+def coarse_free_map(collision_map, resolution, any_free=True):
+    """
+    Downsample the free space of a collision map into cells of resolution x resolution pixels
+    A cell is free when any of its pixels is free, so narrow passages are kept open,
+    or with any_free False only when all of its pixels are free
+    """
+    grid = collision_map.grid
+    height, width = grid.shape
+    ny, nx = -(-height // resolution), -(-width // resolution)
+    if (ny*resolution, nx*resolution) != grid.shape:
+        # Pad with obstacles up to a whole number of cells
+        padded = np.zeros((ny*resolution, nx*resolution), dtype=grid.dtype)
+        padded[:height, :width] = grid
+        grid = padded
+    # Reduce the grid itself rather than a full size free space mask, to keep the memory low
+    cells = grid.reshape(ny, resolution, nx, resolution)
+    reduced = cells.max(axis=(1, 3)) if any_free else cells.min(axis=(1, 3))
+    return reduced > collision_map.threshold
+
+
+# Moves of the Dijkstra over cell corners, (row, col, cost in cells, cells the move runs along or across), a move
+# stays in the free space when any of its cells is free. Corner (row, col) is the top left corner of cell (row, col)
+CORNER_MOVES = ((0, 1, 1, ((-1, 0), (0, 0))), (0, -1, 1, ((-1, -1), (0, -1))),
+                (1, 0, 1, ((0, -1), (0, 0))), (-1, 0, 1, ((-1, -1), (-1, 0))),
+                (1, 1, sqrt(2), ((0, 0),)), (1, -1, sqrt(2), ((0, -1),)),
+                (-1, 1, sqrt(2), ((-1, 0),)), (-1, -1, sqrt(2), ((-1, -1),)))
+
+# Largest ratio of an 8 connected grid distance to the straight line distance, at 22.5 degrees
+OCTILE_RATIO = sqrt(4 - 2*sqrt(2))
+
+
+def corner_dijkstra(free, goal_corner):
+    """
+    Distance in cells from every cell corner to the goal corner over 8 connected moves along the edges and diagonals
+    of free cells, inf when unreachable
+    """
+
+    ny, nx = free.shape
+    distance = np.full((ny + 1, nx + 1), np.inf)
+    row, col = goal_corner
+    distance[row, col] = 0
+    q = [(0, row, col)]
+
+    # Plain lists are much faster than numpy arrays for single cell access, padded with obstacles
+    distance_list = distance.tolist()
+    free_list = np.pad(free, 1).tolist()
+
+    while q:
+        d, row, col = heapq.heappop(q)
+        if d > distance_list[row][col]:
+            continue
+        for drow, dcol, cost, cells in CORNER_MOVES:
+            r, c = row + drow, col + dcol
+            if not (0 <= r <= ny and 0 <= c <= nx):
+                continue
+            if not any(free_list[row + crow + 1][col + ccol + 1] for crow, ccol in cells):
+                continue
+            new_d = d + cost
+            if new_d < distance_list[r][c]:
+                distance_list[r][c] = new_d
+                heapq.heappush(q, (new_d, r, c))
+
+    return np.array(distance_list)
+
+
+class DijkstraHeuristic:
+    """
+    Cost to go estimated by a grid Dijkstra from the goal over a coarse free space map (mm)
+    It follows the way around the walls and the circle, where the straight line distance points into dead ends
+    The shortest path through the free cells bends at cell corners, so the distances are searched between corners,
+    and the 8 connected distance of every straight piece is at most OCTILE_RATIO times its length. Divided by it,
+    less the distances from the state and the goal to their corners, it is a lower bound of the cost to go, and the
+    plans stay optimal. The straight line distance is used where it is larger
+    """
+
+    def __init__(self, collision_map, goal, resolution=50):
+        self.resolution = resolution
+        self.x_goal, self.y_goal = goal[0], goal[1]
+        free = coarse_free_map(collision_map, resolution)
+        # Nearest corner of the goal cell, whose corners are all connected as the goal cell is free
+        goal_corner = (int(self.y_goal) // resolution + (self.y_goal % resolution > resolution / 2),
+                       int(self.x_goal) // resolution + (self.x_goal % resolution > resolution / 2))
+        goal_offset = dist((goal_corner[1]*resolution, goal_corner[0]*resolution), (self.x_goal, self.y_goal))
+        # Lower bounds of the distance from every corner to the goal, in mm
+        self.field = grid = corner_dijkstra(free, goal_corner) * (resolution / OCTILE_RATIO) - goal_offset
+        self._rows = grid.tolist()
+
+    def __call__(self, x, y):
+        """Estimated cost to go from (x, y) in canvas coordinates, inf when the goal cannot be reached"""
+        resolution, rows = self.resolution, self._rows
+        row, col = int(y) // resolution, int(x) // resolution
+        # The corners of a free cell are connected, so they are all unreachable or none is
+        if rows[row][col] == inf:
+            return inf
+        x0, y0 = col*resolution, row*resolution
+        x1, y1 = x0 + resolution, y0 + resolution
+        u, v = (x - x0) / resolution, (y - y0) / resolution
+        # Every corner of the cell bounds the cost to go, less the straight way to it inside the cell. Blending the
+        # bounds of the corners bilinearly keeps the estimate continuous across the cells
+        h = ((1 - u)*(1 - v)*(rows[row][col] - dist((x, y), (x0, y0)))
+             + u*(1 - v)*(rows[row][col + 1] - dist((x, y), (x1, y0)))
+             + (1 - u)*v*(rows[row + 1][col] - dist((x, y), (x0, y1)))
+             + u*v*(rows[row + 1][col + 1] - dist((x, y), (x1, y1))))
+        return max(h, dist((x, y), (self.x_goal, self.y_goal)))
+
+
+def euclidean_heuristic(goal):
+    """Straight line distance to the goal"""
+    x_goal, y_goal = goal[0], goal[1]
+
+    def heuristic(x, y):
+        return dist((x, y), (x_goal, y_goal))
+    return heuristic
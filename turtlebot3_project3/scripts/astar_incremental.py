@@ -0,0 +1,334 @@
+"""
+Incremental replanning with D* Lite over the motion lattice
+The graph and its costs to the goal are kept between plans, so when the robot drifts off its path or the map
+changes, only the affected part of the search is repaired instead of planning from scratch
+"""
+
+import time
+from math import ceil, dist, floor, hypot
+
+import numpy as np
+
+from astar_planner import IndexedHeap, PlannerParams, PlanResult, SearchStats, load_lattice
+
+
+class IncrementalPlanner:
+    """
+    D* Lite from a goal (x, y) to a moving start, in canvas coordinates (top left as origin)
+    Nodes are the (x, y, theta) bins of the A* search, distance_threshold by distance_threshold by angular_threshold,
+    and edges are the actions of the motion lattice applied from the bin centers. An edge is blocked when any of
+    its samples is outside free space, and leads to the bin its last sample falls in. The goal is every heading
+    of the goal bin, and paths run through bin centers, the first point being the start itself. The inputs of the
+    path are the actions of its edges, which only reproduce it from the bin centers, so it is meant to be tracked
+    point by point. A corridor (astar_corridor.Corridor), e.g. around the path of the A* search, limits the search to
+    the bins whose centers it contains.
+    """
+
+    # Edges with more samples, as the dense arcs of the 'arc' motion model, are checked with NumPy
+    LOOP_SAMPLES = 8
+
+    def __init__(self, collision_map, goal, params=None, lattice=None, corridor=None):
+        if params is None:
+            params = PlannerParams()
+        if lattice is None:
+            lattice = load_lattice(params)
+
+        self.collision_map = collision_map
+        self.goal = goal
+        self.corridor = corridor
+        self.params = params
+        self.stats = SearchStats()
+
+        self.size = params.distance_threshold
+        self.nx = int(collision_map.width // self.size) + 1
+        self.ny = int(collision_map.height // self.size) + 1
+        self.n_headings = max(1, int(round(360 / params.angular_threshold)))
+        self.heading_size = 360 / self.n_headings
+        self.action_set = params.action_set
+
+        # Edges of every heading, translation invariant on the bin grid:
+        # (action, (rpm_l, rpm_r), bin offset x, bin offset y, heading of the child, cost, sample offsets)
+        self.edges = []
+        for k in range(self.n_headings):
+            theta = self.heading(k)
+            edges = []
+            for a, action in enumerate(self.action_set):
+                h = lattice.heading_index(theta)
+                dx_end, dy_end = float(lattice.dx[h, a, -1]), float(lattice.dy[h, a, -1])
+                dtheta_end, arc = float(lattice.dtheta[a, -1]), float(lattice.arc[a, -1])
+                di = floor(0.5 + dx_end / self.size)
+                dj = floor(0.5 + dy_end / self.size)
+                k_child = self.heading_bin(theta + dtheta_end)
+                # Actions ending in the same bin do not move the search
+                if di == 0 and dj == 0 and k_child == k:
+                    continue
+                # Snapping to the bin centers may stretch an action, the cost covers the distance between the centers
+                # so the straight line heuristic stays consistent
+                cost = max(int(arc), ceil(hypot(di, dj) * self.size))
+                samples = np.stack([lattice.dx[h, a], lattice.dy[h, a]])
+                # Short Euler sample lists are faster to check one by one than with NumPy
+                if samples.shape[1] <= self.LOOP_SAMPLES:
+                    samples = list(zip(*samples.tolist()))
+                edges.append((a, action, di, dj, k_child, cost, samples))
+            self.edges.append(edges)
+
+        # Reversed edges, the parents of a node of each heading: (parent heading, edge)
+        self.reverse_edges = [[] for _ in range(self.n_headings)]
+        for k, edges in enumerate(self.edges):
+            for edge in edges:
+                self.reverse_edges[edge[4]].append((k, edge))
+
+        # Longest reach of an action from its bin center, to find the edges crossing a changed region
+        self.reach = max(np.abs(lattice.dx).max(initial=0), np.abs(lattice.dy).max(initial=0)) + self.size
+
+        self.edge_cost = {}
+        self.g = {}
+        self.rhs = {}
+        self.open = IndexedHeap()
+        self.km = 0
+        self.last_start = None
+        self.start = None
+
+        i_goal, j_goal = self.cell(goal[0], goal[1])
+        self.goals = {self.node(i_goal, j_goal, k) for k in range(self.n_headings)}
+        for node in self.goals:
+            self.rhs[node] = 0
+
+    # Discretization
+
+    def heading(self, k):
+        """Heading of a heading bin (degrees within -180 and 180)"""
+        theta = k * self.heading_size
+        return theta - 360 if theta > 180 else theta
+
+    def heading_bin(self, theta):
+        return int(round(theta / self.heading_size)) % self.n_headings
+
+    def cell(self, x, y):
+        return int(x // self.size), int(y // self.size)
+
+    def node(self, i, j, k):
+        return (i * self.ny + j) * self.n_headings + k
+
+    def decode(self, node):
+        ij, k = divmod(node, self.n_headings)
+        i, j = divmod(ij, self.ny)
+        return i, j, k
+
+    def center(self, node):
+        """(x, y, theta) at the center of a node"""
+        i, j, k = self.decode(node)
+        return (i + 0.5) * self.size, (j + 0.5) * self.size, self.heading(k)
+
+    def node_of(self, state):
+        """Node of a state (x, y, theta)"""
+        i, j = self.cell(state[0], state[1])
+        return self.node(i, j, self.heading_bin(state[2]))
+
+    # Graph
+
+    def cost(self, node, edge):
+        """Cost of an edge from a node, inf when it is blocked"""
+        key = node * len(self.action_set) + edge[0]
+        cost = self.edge_cost.get(key)
+        if cost is None:
+            cost = self._edge_cost(node, edge)
+            self.edge_cost[key] = cost
+        return cost
+
+    def _edge_cost(self, node, edge):
+        x, y, _ = self.center(node)
+        samples = edge[6]
+        dense = isinstance(samples, np.ndarray)
+        self.stats.collision_checks += (samples.shape[1] if dense else len(samples)) + 1
+        is_free = self.collision_map.is_free
+        if not is_free(x, y) or (self.corridor is not None and not self.corridor.contains(x, y)):
+            return np.inf
+        if not dense:
+            return edge[5] if all(is_free(x + dx, y + dy) for dx, dy in samples) else np.inf
+        # All the samples of a dense arc at once
+        return edge[5] if self.collision_map.all_free(x + samples[0], y + samples[1]) else np.inf
+
+    def successors(self, node):
+        """(child, cost, edge) of every edge from a node"""
+        i, j, k = self.decode(node)
+        return [(self.node(i + edge[2], j + edge[3], edge[4]), self.cost(node, edge), edge) for edge in self.edges[k]]
+
+    def predecessors(self, node):
+        """(parent, cost) of every edge into a node"""
+        i, j, k = self.decode(node)
+        parents = []
+        for k_parent, edge in self.reverse_edges[k]:
+            i_parent, j_parent = i - edge[2], j - edge[3]
+            if 0 <= i_parent < self.nx and 0 <= j_parent < self.ny:
+                parent = self.node(i_parent, j_parent, k_parent)
+                parents.append((parent, self.cost(parent, edge)))
+        return parents
+
+    # D* Lite
+
+    def heuristic(self, node):
+        """Straight line distance from the start to a node"""
+        x, y, _ = self.center(node)
+        x_start, y_start, _ = self.center(self.start)
+        return dist((x, y), (x_start, y_start))
+
+    def key(self, node):
+        g_rhs = min(self.g.get(node, np.inf), self.rhs.get(node, np.inf))
+        return (g_rhs + self.heuristic(node) + self.km, g_rhs)
+
+    def update_vertex(self, node):
+        if node not in self.goals:
+            self.rhs[node] = min((cost + self.g.get(child, np.inf) for child, cost, _ in self.successors(node)),
+                                 default=np.inf)
+        self._update_open(node)
+
+    def _update_open(self, node):
+        consistent = self.g.get(node, np.inf) == self.rhs.get(node, np.inf)
+        if not consistent:
+            if self.open.push(node, self.key(node)):
+                self.stats.heap_pushes += 1
+        elif node in self.open:
+            self.open.remove(node)
+
+    def compute_shortest_path(self, cancel=None, max_expansions=None):
+        """
+        Expand nodes until the costs of the start are consistent, cancel (threading.Event) is set or
+        max_expansions are made, returns True when the costs of the start are consistent
+        """
+
+        stats, g, rhs, q = self.stats, self.g, self.rhs, self.open
+        start = self.start
+        while q and (q.top()[0] < self.key(start) or rhs.get(start, np.inf) > g.get(start, np.inf)):
+            # Stopping between expansions keeps the open list valid, so the next plan() resumes the search
+            if cancel is not None and cancel.is_set():
+                return False
+            if max_expansions is not None and stats.expansions >= max_expansions:
+                return False
+            k_old, node = q.top()
+            k_new = self.key(node)
+            if k_old < k_new:
+                q.push(node, k_new)
+                continue
+
+            stats.expansions += 1
+            g_node, rhs_node = g.get(node, np.inf), rhs.get(node, np.inf)
+            if g_node > rhs_node:
+                # The node got cheaper, its parents may get cheaper through it
+                g[node] = rhs_node
+                q.remove(node)
+                for parent, cost in self.predecessors(node):
+                    if parent not in self.goals and cost + rhs_node < rhs.get(parent, np.inf):
+                        rhs[parent] = cost + rhs_node
+                        self._update_open(parent)
+            else:
+                # The node got more expensive, the parents that went through it look for another child
+                g[node] = np.inf
+                stats.reopened += 1
+                for parent, cost in self.predecessors(node):
+                    if rhs.get(parent, np.inf) == cost + g_node:
+                        self.update_vertex(parent)
+                self.update_vertex(node)
+            stats.peak_open = max(stats.peak_open, len(q))
+        return True
+
+    def plan(self, start, cancel=None, max_expansions=None):
+        """
+        Path from start (x, y, theta) to the goal, repairing the search from the previous plan
+        Returns a PlanResult, its stats count the work of this call only. It is not reached when cancel is set or
+        the search needs more than max_expansions, the next plan() then resumes it
+        """
+
+        begin = time.perf_counter()
+        self.stats = SearchStats()
+        start_node = self.node_of(start)
+        if self.start is None:
+            self.start = self.last_start = start_node
+            for node in self.goals:
+                self.open.push(node, self.key(node))
+                self.stats.heap_pushes += 1
+        elif start_node != self.start:
+            # The heuristic is relative to the start, so keys already in the open list are raised lazily by km
+            self.start = start_node
+            self.km += self.heuristic(self.last_start)
+            self.last_start = start_node
+
+        # No path leaves a start whose every edge is blocked, rather than exhausting the search from the goal
+        path = []
+        if any(cost < np.inf for _, cost, _ in self.successors(start_node)) or start_node in self.goals:
+            if self.compute_shortest_path(cancel, max_expansions):
+                path = self._path(start)
+        self.stats.time = time.perf_counter() - begin
+        self.stats.nodes = len(self.g)
+        cost = float(self.rhs.get(start_node, np.inf)) if path else np.inf
+        return PlanResult(bool(path), path, [(rpm_l, rpm_r) for *_, rpm_l, rpm_r in path], cost, self.stats, None)
+
+    def _path(self, start):
+        """Follow the cheapest children from the start to the goal, empty when the goal cannot be reached"""
+        node = self.start
+        # The search stops once the start is locally consistent, its cost is rhs rather than g
+        if self.rhs.get(node, np.inf) == np.inf:
+            return []
+        path = [(start[0], start[1], start[2], 0, 0)]
+        for _ in range(len(self.g) + 1):
+            if node in self.goals:
+                return path
+            child, _, edge = min(self.successors(node), key=lambda child: child[1] + self.g.get(child[0], np.inf))
+            node = child
+            path.append(self.center(node) + edge[1])
+        return []
+
+    def update_map(self, collision_map):
+        """
+        Switch to a new collision map of the same size, and repair the costs of the edges crossing changed cells
+        Returns the number of edges whose cost changed, the next plan() repairs the search
+        """
+
+        old = self.collision_map
+        self.collision_map = collision_map
+        changed = (old.grid > old.threshold) != (collision_map.grid > collision_map.threshold)
+        rows, cols = np.nonzero(changed)
+        if len(rows) == 0:
+            return 0
+
+        # Bins whose edges can reach a changed cell
+        reach = int(np.ceil(self.reach / self.size))
+        cells = set(zip((cols // self.size).astype(int).tolist(), (rows // self.size).astype(int).tolist()))
+        sources = set()
+        for i, j in cells:
+            for i_near in range(max(0, i - reach), min(self.nx, i + reach + 1)):
+                for j_near in range(max(0, j - reach), min(self.ny, j + reach + 1)):
+                    sources.add((i_near, j_near))
+
+        # Edges not evaluated yet are computed with the new map when the search needs them
+        n_actions = len(self.action_set)
+        updates = []
+        for i, j in sources:
+            for k in range(self.n_headings):
+                node = self.node(i, j, k)
+                for edge in self.edges[k]:
+                    key = node * n_actions + edge[0]
+                    old_cost = self.edge_cost.get(key)
+                    if old_cost is None:
+                        continue
+                    new_cost = self._edge_cost(node, edge)
+                    if new_cost != old_cost:
+                        self.edge_cost[key] = new_cost
+                        updates.append((node, edge, old_cost, new_cost))
+
+        if not updates:
+            return 0
+        # Nodes whose cheapest edge got cheaper or went through a blocked edge are queued again
+        for node, edge, old_cost, new_cost in updates:
+            if node in self.goals:
+                continue
+            i, j, _ = self.decode(node)
+            _, _, di, dj, k_child, _, _ = edge
+            g_child = self.g.get(self.node(i + di, j + dj, k_child), np.inf)
+            rhs_node = self.rhs.get(node, np.inf)
+            if new_cost < old_cost:
+                self.rhs[node] = min(rhs_node, new_cost + g_child)
+                self._update_open(node)
+            elif rhs_node == old_cost + g_child:
+                self.update_vertex(node)
+        return len(updates)
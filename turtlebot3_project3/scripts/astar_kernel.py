@@ -0,0 +1,98 @@
+"""
+Optional compiled expansion kernel of the A* search, the work of astar_planner.batch_successors() after the
+sample offsets are known: collision checks, angle wrapping, clamping and binning into state IDs
+It is compiled with Numba when it is installed (pip install numba). Without Numba AVAILABLE is False,
+and the planner keeps its NumPy successors, as the kernel would run as slow interpreted loops
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+AVAILABLE = numba is not None
+
+
+def _jit(function):
+    """Compile a function with Numba when it is installed, the compiled code is cached next to this file"""
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+@_jit
+def _is_free(grid, width, threshold, x, y):
+    """Same lookup as batch_successors(), out of range cells are clipped onto the border of the map"""
+    cell = int(np.rint(y*2)/2) * width + int(np.rint(x*2)/2)
+    cell = min(max(cell, 0), grid.size - 1)
+    return grid[cell] > threshold
+
+
+@_jit
+def _bin(value, threshold):
+    """Same binning as adjust() and ArrayStateTable.keys()"""
+    return int(int(np.rint(value*2)/2) / threshold)
+
+
+@_jit
+def expand(grid, width, height, threshold, clearance, x, y, theta, dx, dy, dtheta, arc,
+           distance_threshold, angular_threshold, ny, ntheta, key_offset):
+    """
+    Children of a node (x, y, theta) from the (actions, steps) sample offsets of every action
+    grid is the flattened collision map, the state IDs are the ones of an ArrayStateTable
+    Returns arrays (x, y, theta, action cost, state ID, action index) of the children in free space,
+    and the number of samples looked up
+    """
+
+    n_actions, n_steps = dx.shape
+    x_new = np.empty(n_actions)
+    y_new = np.empty(n_actions)
+    theta_new = np.empty(n_actions)
+    action_cost = np.empty(n_actions, dtype=np.int64)
+    keys = np.empty(n_actions, dtype=np.int64)
+    actions = np.empty(n_actions, dtype=np.int64)
+    n = 0
+    checks = 0
+
+    for a in range(n_actions):
+        # Each action stops at the last sample before the obstacle space
+        last = -1
+        for s in range(n_steps):
+            checks += 1
+            if not _is_free(grid, width, threshold, x + dx[a, s], y + dy[a, s]):
+                break
+            last = s
+        if last < 0:
+            continue
+
+        x_child = x + dx[a, last]
+        y_child = y + dy[a, last]
+        theta_child = theta + dtheta[a, last]
+
+        # Keep the heading angle within 180 and -180
+        if theta_child > 180:
+            theta_child -= 360
+        if theta_child < -180:
+            theta_child += 360
+
+        # Cap the new node values within the boundaries of the canvas
+        x_child = min(max(x_child, clearance), width-clearance)
+        y_child = min(max(y_child, clearance), height-clearance)
+
+        # Check if the new node is in the free space
+        checks += 1
+        if not _is_free(grid, width, threshold, x_child, y_child):
+            continue
+
+        x_new[n] = x_child
+        y_new[n] = y_child
+        theta_new[n] = theta_child
+        action_cost[n] = int(arc[a, last])
+        keys[n] = ((_bin(x_child, distance_threshold) * ny + _bin(y_child, distance_threshold)) * ntheta
+                   + _bin(theta_child, angular_threshold) + key_offset)
+        actions[n] = a
+        n += 1
+
+    return x_new[:n], y_new[:n], theta_new[:n], action_cost[:n], keys[:n], actions[:n], checks
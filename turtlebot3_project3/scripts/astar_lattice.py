@@ -0,0 +1,208 @@
+"""Motion primitives of the action set precomputed for every discretized heading"""
+
+import hashlib
+import json
+import os
+from functools import cached_property
+
+import numpy as np
+
+import astar_map
+
+# Bump this whenever the integration below changes, so stale cached lattices are not reused
+LATTICE_VERSION = 2
+
+# Integration of an action: 'euler' for the 0.1 s Euler steps of the original planner,
+# 'arc' for the exact constant curvature arc of the wheel speeds
+MOTION_MODELS = ('euler', 'arc')
+
+
+def euler_steps(T, dt=0.1):
+    """Number of Euler steps taken by the 'while t < T: t += dt' loop of the planner"""
+    t = 0
+    steps = 0
+    while t < T:
+        t += dt
+        steps += 1
+    return steps
+
+
+def arc_steps(action_set, T, wheel_radius, resolution=1):
+    """Number of samples along the arcs, so the samples of the fastest action are at most resolution (mm) apart"""
+    rpm = np.array(action_set, dtype=float)
+    speed = np.abs(wheel_radius/2 * 2 * np.pi * (rpm[:, 0] + rpm[:, 1]) / 60)
+    return max(1, int(np.ceil(speed.max() * T / resolution)))
+
+
+class MotionLattice:
+    """
+    Sample offsets, heading changes and arc lengths of every action at every heading bin
+    With the 'euler' motion model the samples are the intermediate states of the Euler integration of the planner,
+    with 'arc' they are points of the exact arc every arc_resolution (mm) or less, the last one at T
+    Sample s of action a from heading bin h ends at (x + dx[h, a, s], y + dy[h, a, s])
+    """
+
+    def __init__(self, action_set, T, wheel_radius, wheel_distance, heading_resolution=1, dt=0.1,
+                 motion_model='euler', arc_resolution=1, arrays=None):
+        if motion_model not in MOTION_MODELS:
+            raise ValueError(f'Unknown motion model: {motion_model}')
+        self.action_set = [tuple(action) for action in action_set]
+        self.T = T
+        self.dt = dt
+        self.motion_model = motion_model
+        self.arc_resolution = arc_resolution
+        self.wheel_radius = wheel_radius
+        self.wheel_distance = wheel_distance
+        self.heading_resolution = heading_resolution
+        self.n_headings = int(round(360/heading_resolution))
+
+        if arrays is None:
+            arrays = self._integrate() if motion_model == 'euler' else self._arcs()
+        self.dx, self.dy, self.dtheta, self.arc = arrays
+
+    @cached_property
+    def primitives(self):
+        """
+        Nested lists are much faster than NumPy scalar indexing in the hot loop
+        primitives[h][a] is a list of (dx, dy, dtheta, arc) samples, built on first use as dense arcs take memory
+        """
+        return [[list(zip(self.dx[h, a].tolist(), self.dy[h, a].tolist(),
+                          self.dtheta[a].tolist(), self.arc[a].tolist()))
+                 for a in range(len(self.action_set))]
+                for h in range(self.n_headings)]
+
+    def _integrate(self):
+        """Run the Euler integration of every action from every heading bin at once"""
+        steps = euler_steps(self.T, self.dt)
+        dt = self.dt
+
+        # Headings of the bins, from -180 in steps of the resolution
+        headings = -180 + self.heading_resolution*np.arange(self.n_headings)
+        rpm = np.array(self.action_set, dtype=float)
+        ul = 2 * np.pi * rpm[:, 0] / 60
+        ur = 2 * np.pi * rpm[:, 1] / 60
+
+        speed = self.wheel_radius/2 * (ul + ur)
+        dtheta_dt = np.rad2deg(self.wheel_radius/self.wheel_distance * (ur - ul))
+
+        n_actions = len(self.action_set)
+        dx = np.zeros((self.n_headings, n_actions, steps))
+        dy = np.zeros((self.n_headings, n_actions, steps))
+        dtheta = np.zeros((n_actions, steps))
+        arc = np.zeros((n_actions, steps))
+
+        x = np.zeros((self.n_headings, n_actions))
+        y = np.zeros((self.n_headings, n_actions))
+        turn = np.zeros(n_actions)
+        d = np.zeros(n_actions)
+        for s in range(steps):
+            theta = headings[:, None] + turn
+            x = x + speed * np.cos(np.radians(theta)) * dt
+            y = y + speed * np.sin(np.radians(theta)) * dt
+            turn = turn + dtheta_dt * dt
+            d = d + np.abs(speed) * dt
+
+            dx[:, :, s] = x
+            dy[:, :, s] = y
+            dtheta[:, s] = turn
+            arc[:, s] = d
+
+        return dx, dy, dtheta, arc
+
+    def _arcs(self):
+        """Sample the exact arc of every action from every heading bin, in closed form"""
+        steps = arc_steps(self.action_set, self.T, self.wheel_radius, self.arc_resolution)
+        t = self.T * np.arange(1, steps + 1) / steps
+
+        headings = np.radians(-180 + self.heading_resolution*np.arange(self.n_headings))
+        rpm = np.array(self.action_set, dtype=float)
+        ul = 2 * np.pi * rpm[:, 0] / 60
+        ur = 2 * np.pi * rpm[:, 1] / 60
+
+        # Constant wheel speeds drive a constant curvature arc
+        speed = self.wheel_radius/2 * (ul + ur)
+        turn = (self.wheel_radius/self.wheel_distance * (ur - ul))[:, None] * t
+
+        # The chord of an arc turning by phi has length (arc length) * sin(phi/2) / (phi/2), in the direction of the
+        # heading turned by phi/2, np.sinc() covers the straight actions without dividing by zero
+        chord = speed[:, None] * t * np.sinc(turn / (2 * np.pi))
+        direction = headings[:, None, None] + turn / 2
+        dx = chord * np.cos(direction)
+        dy = chord * np.sin(direction)
+        dtheta = np.rad2deg(turn)
+        arc = np.abs(speed)[:, None] * t
+
+        return dx, dy, dtheta, arc
+
+    def heading_index(self, theta):
+        """Return the heading bin nearest to theta (degrees)"""
+        return int(round((theta + 180)/self.heading_resolution)) % self.n_headings
+
+
+class AdaptiveLattice:
+    """
+    Motion lattices of one action set for increasing durations, the longer actions are taken where the clearance
+    allows (see level())
+    Actions are numbered across the levels, action a of level k is k * len(action_set) + a in action_set
+    """
+
+    def __init__(self, levels):
+        self.levels = levels
+        self.n_actions = len(levels[0].action_set)
+        self.action_set = [action for lattice in levels for action in lattice.action_set]
+        # Farthest any sample of a level gets from the state its action starts from
+        self.reach = [float(np.hypot(lattice.dx, lattice.dy).max(initial=0)) for lattice in levels]
+
+    def level(self, margin):
+        """
+        Longest level whose samples all stay within margin (mm) of the state they start from
+        With margin the distance to the obstacle space (distance field minus clearance), every sample of that level
+        is in free space, the distance field changing by at most 1 mm per mm
+        """
+        level = 0
+        # One more mm for the rounding of positions to cells
+        while level + 1 < len(self.levels) and self.reach[level + 1] + 1 < margin:
+            level += 1
+        return level
+
+
+def lattice_key(action_set, T, wheel_radius, wheel_distance, heading_resolution=1, dt=0.1, motion_model='euler',
+                arc_resolution=1):
+    """Hash of the lattice configuration, used to name cached lattices"""
+    config = {'version': LATTICE_VERSION, 'action_set': [list(action) for action in action_set], 'T': T, 'dt': dt,
+              'wheel_radius': wheel_radius, 'wheel_distance': wheel_distance,
+              'heading_resolution': heading_resolution, 'motion_model': motion_model,
+              'arc_resolution': arc_resolution}
+    return hashlib.sha1(json.dumps(config).encode()).hexdigest()[:16]
+
+
+_loaded = {}
+
+
+def load_lattice(action_set, T, wheel_radius, wheel_distance, heading_resolution=1, dt=0.1, motion_model='euler',
+                 arc_resolution=1, cache_dir=astar_map.CACHE_DIR):
+    """Load the lattice from the on-disk cache next to the maps, building and storing it on a miss"""
+
+    config = (action_set, T, wheel_radius, wheel_distance, heading_resolution, dt, motion_model, arc_resolution)
+    if cache_dir is None:
+        return MotionLattice(*config)
+
+    # Lattices already loaded by this process are reused
+    key = lattice_key(*config)
+    if key in _loaded:
+        return _loaded[key]
+
+    path = os.path.join(cache_dir, f'lattice_{key}.npz')
+    try:
+        with np.load(path) as data:
+            arrays = (data['dx'], data['dy'], data['dtheta'], data['arc'])
+        _loaded[key] = MotionLattice(*config, arrays)
+        return _loaded[key]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    lattice = MotionLattice(*config)
+    astar_map.write_atomic(path, lambda f: np.savez(f, dx=lattice.dx, dy=lattice.dy, dtheta=lattice.dtheta,
+                                                    arc=lattice.arc))
+    _loaded[key] = lattice
+    return lattice
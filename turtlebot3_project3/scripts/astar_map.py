@@ -0,0 +1,248 @@
+"""Obstacle and clearance map of the competition world, shared by the A* planners"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import cv2
+
+# Define map parameters
+WIDTH = 6000 #mm
+HEIGHT = 2000 #mm
+
+# Obstacles in canvas coordinates (top left as origin)
+# Rectangles are (x1, x2, y1, y2) with half-open ranges, circles are (x_center, y_center, radius)
+RECTANGLES = ((1500, 1750, 0, 1000),
+              (2500, 2750, HEIGHT-1000, HEIGHT))
+CIRCLES = ((4200, 800, 600),)
+
+FREE_COLOR = (255, 255, 255)
+CLEARANCE_COLOR = (0, 255, 255)
+OBSTACLE_COLOR = (0, 0, 0)
+
+# Bump this whenever the rasterization below changes, so stale cached maps are not reused
+MAP_VERSION = 1
+
+CACHE_DIR = os.environ.get('ASTAR_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'astar_turtlebot3'))
+
+
+def flip_y(y, height=HEIGHT):
+    """Convert a y coordinate between the map frame (bottom left as origin) and the canvas (top left as origin)"""
+    return height-y-1
+
+
+def build_canvas(clearance, width=WIDTH, height=HEIGHT, rectangles=RECTANGLES, circles=CIRCLES):
+    """Rasterize the obstacles and their clearance bands into a BGR canvas"""
+
+    # Create a black canvas
+    canvas = np.zeros((height, width, 3), dtype="uint8")
+    # Create a white rectangle, the border of width clearance stays black
+    canvas = cv2.rectangle(canvas, (clearance, clearance), (width-clearance, height-clearance), FREE_COLOR, -1)
+
+    # Clearance bands are only painted inside the white rectangle
+    x_min, x_max = clearance, width-clearance+1
+    y_min, y_max = clearance, height-clearance+1
+
+    for x1, x2, y1, y2 in rectangles:
+        # Draw the clearance
+        canvas[max(y1-clearance, y_min):min(y2+clearance, y_max),
+               max(x1-clearance, x_min):min(x2+clearance, x_max)] = CLEARANCE_COLOR
+        # Draw the obstacle
+        canvas[max(y1, 0):min(y2, height), max(x1, 0):min(x2, width)] = OBSTACLE_COLOR
+
+    for x_center, y_center, radius in circles:
+        # Draw the clearance over the free pixels only
+        rows, cols, inside = _disk(x_center, y_center, radius+clearance, width, height)
+        region = canvas[rows, cols]
+        region[inside & (region[:, :, 0] != 0)] = CLEARANCE_COLOR
+        # Draw the obstacle
+        rows, cols, inside = _disk(x_center, y_center, radius, width, height)
+        canvas[rows, cols][inside] = OBSTACLE_COLOR
+
+    return canvas
+
+
+def _disk(x_center, y_center, radius, width, height):
+    """Return the bounding box slices of a disk and the mask of the pixels inside it"""
+    x1, x2 = max(x_center-radius, 0), min(x_center+radius, width)
+    y1, y2 = max(y_center-radius, 0), min(y_center+radius, height)
+    j, i = np.ogrid[y1:y2, x1:x2]
+    inside = (i-x_center)**2 + (j-y_center)**2 <= radius**2
+    return slice(y1, y2), slice(x1, x2), inside
+
+
+def build_distance_field(width=WIDTH, height=HEIGHT, rectangles=RECTANGLES, circles=CIRCLES):
+    """
+    Euclidean distance (mm) from every pixel to the nearest obstacle or map edge
+    A pixel is in free space for a clearance when its distance is greater than the clearance,
+    so one field serves every robot radius and safety margin
+    """
+
+    # Obstacles are zero, with a one pixel border of zeros standing for the map edges
+    free = np.zeros((height+2, width+2), dtype="uint8")
+    free[1:-1, 1:-1] = 1
+    interior = free[1:-1, 1:-1]
+
+    for x1, x2, y1, y2 in rectangles:
+        interior[max(y1, 0):min(y2, height), max(x1, 0):min(x2, width)] = 0
+
+    for x_center, y_center, radius in circles:
+        rows, cols, inside = _disk(x_center, y_center, radius, width, height)
+        interior[rows, cols][inside] = 0
+
+    field = cv2.distanceTransform(free, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    return np.ascontiguousarray(field[1:-1, 1:-1])
+
+
+def build_occupancy(field, clearance):
+    """
+    Free space of a clearance as a boolean grid (True is free), a byte per pixel instead of the
+    four of the distance field or the three of a canvas
+    """
+    return np.ascontiguousarray(field > clearance)
+
+
+def canvas_from_distance_field(field, clearance):
+    """Colour a distance field like build_canvas(), for visualization"""
+    canvas = np.full(field.shape + (3,), FREE_COLOR, dtype="uint8")
+    canvas[field <= clearance] = CLEARANCE_COLOR
+    canvas[field == 0] = OBSTACLE_COLOR
+    return canvas
+
+
+class CollisionMap:
+    """
+    Free space lookups shared by the planners, a cell is free when grid[row, col] > threshold
+    The grid is the first channel of a canvas, a distance field compared against the clearance,
+    or a boolean occupancy grid (True is free) compared against 0
+    """
+
+    def __init__(self, grid, threshold):
+        self.grid = grid
+        self.threshold = threshold
+        self.height, self.width = grid.shape
+        self._flat = None
+
+    @classmethod
+    def from_canvas(cls, canvas):
+        """Free space is the white part of a canvas"""
+        return cls(canvas[:, :, 0], 254)
+
+    @classmethod
+    def from_distance_field(cls, field, clearance):
+        """Free space is farther than the clearance from every obstacle"""
+        return cls(field, clearance)
+
+    @classmethod
+    def from_occupancy(cls, free):
+        """Free space is the True cells of a boolean grid, such as a memory mapped one from load_occupancy()"""
+        return cls(free, 0)
+
+    def with_clearance(self, clearance):
+        """Return a collision map sharing the same distance field, for another robot radius or safety margin"""
+        if self.grid.dtype == bool:
+            raise ValueError('An occupancy grid is built for a single clearance, use load_occupancy()')
+        return CollisionMap(self.grid, clearance)
+
+    @property
+    def flat(self):
+        """Contiguous flattened grid, so batches of cells can be looked up by flat index"""
+        if self._flat is None:
+            self._flat = np.ascontiguousarray(self.grid).ravel()
+        return self._flat
+
+    def is_free(self, x, y):
+        """Check if the point (x, y) in canvas coordinates is in free space"""
+        col, row = int(round(x*2)/2), int(round(y*2)/2)
+        return 0 <= row < self.height and 0 <= col < self.width and self.grid[row, col] > self.threshold
+
+    def all_free(self, xs, ys):
+        """Check if all the points of the arrays xs and ys are in free space, with the same lookup as is_free()"""
+        cols = (np.rint(xs*2)/2).astype(np.int64)
+        rows = (np.rint(ys*2)/2).astype(np.int64)
+        inside = (cols >= 0) & (cols < self.width) & (rows >= 0) & (rows < self.height)
+        return bool(inside.all() and (self.flat.take(rows * self.width + cols) > self.threshold).all())
+
+
+def map_key(clearance, width=WIDTH, height=HEIGHT, rectangles=RECTANGLES, circles=CIRCLES):
+    """Hash of the clearance and map geometry, used to name cached maps"""
+    geometry = {'version': MAP_VERSION, 'clearance': clearance, 'width': width, 'height': height,
+                'rectangles': rectangles, 'circles': circles}
+    return hashlib.sha1(json.dumps(geometry).encode()).hexdigest()[:16]
+
+
+def load_canvas(clearance, width=WIDTH, height=HEIGHT, rectangles=RECTANGLES, circles=CIRCLES, cache_dir=CACHE_DIR):
+    """Load the canvas from the on-disk cache, building and storing it on a miss"""
+    return _load_cached(f'canvas_{map_key(clearance, width, height, rectangles, circles)}', cache_dir,
+                        lambda: build_canvas(clearance, width, height, rectangles, circles))
+
+
+def load_distance_field(width=WIDTH, height=HEIGHT, rectangles=RECTANGLES, circles=CIRCLES, cache_dir=CACHE_DIR):
+    """Load the distance field from the on-disk cache, building and storing it on a miss"""
+    # The field does not depend on the clearance, so a single file serves every robot
+    return _load_cached(f'distance_{map_key(None, width, height, rectangles, circles)}', cache_dir,
+                        lambda: build_distance_field(width, height, rectangles, circles))
+
+
+def load_occupancy(clearance, width=WIDTH, height=HEIGHT, rectangles=RECTANGLES, circles=CIRCLES,
+                   cache_dir=CACHE_DIR, mmap=True):
+    """
+    Load the occupancy grid of a clearance from the on-disk cache, building and storing it on a miss
+    With mmap the grid is memory mapped read only, so processes planning on the same map share a single copy
+    and only the pages the search reads are loaded
+    """
+    return _load_cached(f'free_{map_key(clearance, width, height, rectangles, circles)}', cache_dir,
+                        lambda: build_occupancy(load_distance_field(width, height, rectangles, circles, cache_dir),
+                                                clearance),
+                        mmap_mode='r' if mmap else None)
+
+
+def distance_field_path(width=WIDTH, height=HEIGHT, rectangles=RECTANGLES, circles=CIRCLES, cache_dir=CACHE_DIR):
+    """
+    Path of the cached distance field, building it on a miss
+    Processes can memory map this file with np.load(path, mmap_mode='r') to share a single copy of the map
+    Returns None when the cache directory is not writable
+    """
+    load_distance_field(width, height, rectangles, circles, cache_dir)
+    path = os.path.join(cache_dir, f'distance_{map_key(None, width, height, rectangles, circles)}.npy')
+    return path if os.path.exists(path) else None
+
+
+def write_atomic(path, write, mode='wb'):
+    """
+    Write a file through a temporary one, so a concurrent reader never sees it partially written
+    write(f) writes the contents to the open file. Returns False when the file could not be written, the caches
+    are only an optimization and planning works without them
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except OSError:
+        return False
+    return True
+
+
+def _load_cached(name, cache_dir, build, mmap_mode=None):
+    """Load an array from the cache directory, building and storing it on a miss, mmap_mode as np.load()"""
+
+    if cache_dir is None:
+        return build()
+
+    path = os.path.join(cache_dir, f'{name}.npy')
+    try:
+        return np.load(path, mmap_mode=mmap_mode)
+    except (OSError, ValueError):
+        pass
+
+    array = build()
+    if write_atomic(path, lambda f: np.save(f, array)) and mmap_mode is not None:
+        # Map the stored copy, rather than keeping the built one in this process
+        try:
+            return np.load(path, mmap_mode=mmap_mode)
+        except (OSError, ValueError):
+            pass
+    return array
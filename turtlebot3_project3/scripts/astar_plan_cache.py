@@ -0,0 +1,184 @@
+"""
+Persistent cache of planned paths, keyed by the map, the planner parameters and the binned start and goal
+Recent plans are kept in memory (LRU), and every plan is stored as a JSON file in the cache directory
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import astar_map
+import astar_planner
+
+# Bump this whenever the stored entries or the planner results change, so stale plans are not reused
+PLAN_CACHE_VERSION = 2
+
+PLAN_CACHE_DIR = os.path.join(astar_map.CACHE_DIR, 'plans')
+
+
+def plan_key(map_hash, params, start, goal):
+    """Hash of the map, the parameters and the start and goal bins of a plan"""
+    dthr, athr = params.distance_threshold, params.angular_threshold
+    key = {'version': PLAN_CACHE_VERSION, 'map': map_hash, 'params': dataclasses.asdict(params),
+           'start': (astar_planner.adjust(start[0], dthr), astar_planner.adjust(start[1], dthr),
+                     astar_planner.adjust(start[2], athr)),
+           'goal': (astar_planner.adjust(goal[0], dthr), astar_planner.adjust(goal[1], dthr))}
+    # Goals with a heading are binned like the start
+    if len(goal) > 2:
+        key['goal'] += (astar_planner.adjust(goal[2], athr),)
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+class PlanCache:
+    """
+    Plans of one map, looked up by parameters and start and goal bins
+    map_hash identifies the map, such as astar_map.map_key(None). The store of a cache directory holds the plans
+    of a single map, and is cleared when it is opened with another map.
+    capacity bounds the plans held in memory and max_entries the files on disk, the least recently used go first
+    cache_dir None keeps the plans in memory only
+    """
+
+    def __init__(self, map_hash, cache_dir=PLAN_CACHE_DIR, capacity=64, max_entries=1000):
+        self.map_hash = map_hash
+        self.cache_dir = cache_dir
+        self.capacity = capacity
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            self._check_map()
+
+    def _check_map(self):
+        """Clear the store when it holds the plans of another map"""
+        stamp = os.path.join(self.cache_dir, 'MAP')
+        try:
+            with open(stamp) as f:
+                if f.read().strip() == self.map_hash:
+                    return
+        except OSError:
+            pass
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._clear_store()
+            with open(stamp, 'w') as f:
+                f.write(self.map_hash)
+        except OSError:
+            pass
+
+    def _entries(self):
+        """Paths of the stored plans"""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        return [os.path.join(self.cache_dir, name) for name in names if name.endswith('.json')]
+
+    def _clear_store(self):
+        for path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Drop every plan, in memory and on disk"""
+        self.memory.clear()
+        if self.cache_dir is not None:
+            self._clear_store()
+
+    def get(self, params, start, goal, budget=None):
+        """
+        PlanResult of a cached plan, None on a miss
+        A plan found with an inflated heuristic (weight above 1), such as one of an anytime plan stopped by its time
+        budget (s), is only served to a caller with no more time, which could not plan a better one. Without a
+        budget only plans of weight 1 are served
+        """
+
+        key = plan_key(self.map_hash, params, start, goal)
+        entry = self._lookup(key)
+        if entry is None or (entry['weight'] > 1 and (budget is None or budget > entry['budget'])):
+            self.misses += 1
+            return None
+        self.hits += 1
+        path = [tuple(point) for point in entry['path']]
+        return astar_planner.PlanResult(True, path, [(rpm_l, rpm_r) for *_, rpm_l, rpm_r in path], entry['cost'],
+                                        astar_planner.SearchStats(), None, entry['weight'])
+
+    def put(self, params, start, goal, result, budget=None):
+        """
+        Store a plan that reached the goal within a time budget (s, None without one), unless a cheaper one is
+        cached for the same key. The cached plan then keeps the largest budget that did not improve it
+        """
+
+        if not result.reached:
+            return
+        budget = float('inf') if budget is None else float(budget)
+        key = plan_key(self.map_hash, params, start, goal)
+        cached = self._lookup(key)
+        if cached is not None and cached['cost'] <= result.cost:
+            if budget <= cached['budget']:
+                return
+            entry = dict(cached, budget=budget)
+        else:
+            entry = {'map': self.map_hash, 'cost': float(result.cost), 'weight': float(result.weight),
+                     'budget': budget, 'path': [[float(x), float(y), float(theta), rpm_l, rpm_r]
+                                                for x, y, theta, rpm_l, rpm_r in result.path]}
+        self._remember(key, entry)
+        if self.cache_dir is not None:
+            self._store(key, entry)
+
+    def _lookup(self, key):
+        """Entry of a key in memory or on disk, None when it is not cached"""
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+        elif self.cache_dir is not None:
+            entry = self._load(key)
+            if entry is not None:
+                self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def _load(self, key):
+        path = os.path.join(self.cache_dir, f'{key}.json')
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            # Mark the plan as recently used for the eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('map') == self.map_hash else None
+
+    def _store(self, key, entry):
+        path = os.path.join(self.cache_dir, f'{key}.json')
+        if astar_map.write_atomic(path, lambda f: json.dump(entry, f), 'w'):
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used plans beyond max_entries"""
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=_mtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _mtime(path):
+    """Modification time of a file, 0 when it was removed meanwhile"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
@@ -0,0 +1,1298 @@
+"""
+A* search over the differential drive action set, shared by the A* planners
+plan() is the entry point, it never reads stdin, opens windows or exits
+"""
+
+import time
+from dataclasses import asdict, dataclass, field, replace
+from math import atan2, ceil, degrees, dist, radians, sin
+
+import numpy as np
+
+import astar_corridor
+import astar_heuristic
+import astar_kernel
+import astar_lattice
+import astar_map
+
+# Define the robot parameters
+WHEEL_RADIUS = 33 #mm
+ROBOT_RADIUS = 220 #mm
+WHEEL_DISTANCE = 287 #mm
+
+# Heuristic weights of the successive searches of plan_anytime()
+ANYTIME_WEIGHTS = (3, 2, 1.5, 1.2, 1)
+
+
+def adjust(x, threshold):
+    """Adjust the value of x to the visited space"""
+    return int(int(round(x*2)/2)/threshold)
+
+
+class DictStateTable:
+    """Visited set and cost tables stored in dictionaries keyed by (x, y, theta) bins"""
+
+    def __init__(self, distance_threshold, angular_threshold):
+        self.distance_threshold = distance_threshold
+        self.angular_threshold = angular_threshold
+        self.visited = {}
+        self.cost_to_come = {}
+        self.cost = {}
+        # Node pool ID of the state held by each bin
+        self.node = {}
+
+    def key(self, x, y, theta):
+        """Return the bin of a state"""
+        return (adjust(x, self.distance_threshold),
+                adjust(y, self.distance_threshold),
+                adjust(theta, self.angular_threshold))
+
+    def is_visited(self, key):
+        return key in self.visited
+
+    def visit(self, key, cost_to_come, cost):
+        """Mark a bin as visited and store its costs"""
+        self.visited[key] = 1
+        self.cost_to_come[key] = cost_to_come
+        self.cost[key] = cost
+
+
+class ArrayStateTable(DictStateTable):
+    """
+    Visited set and cost tables stored in dense arrays indexed by flat state IDs
+    bounds (x_min, y_min, x_max, y_max) limits the arrays to the bins of a region, such as the corridor of a
+    hierarchical plan, instead of the whole map. Every state looked up must then be inside it
+    """
+
+    def __init__(self, width, height, distance_threshold, angular_threshold, bounds=None):
+        self.distance_threshold = distance_threshold
+        self.angular_threshold = angular_threshold
+
+        # Number of bins along each axis from the first one of the region, headings are kept within 180 and -180
+        x_min, y_min, x_max, y_max = bounds if bounds is not None else (0, 0, width, height)
+        self.i_offset = adjust(x_min, distance_threshold)
+        self.j_offset = adjust(y_min, distance_threshold)
+        self.nx = adjust(x_max, distance_threshold) - self.i_offset + 1
+        self.ny = adjust(y_max, distance_threshold) - self.j_offset + 1
+        self.theta_offset = adjust(180, angular_threshold) + 1
+        self.ntheta = 2*self.theta_offset + 1
+        size = self.nx * self.ny * self.ntheta
+        # Added to the state IDs of the bins counted from the corner of the map
+        self.key_offset = -(self.i_offset * self.ny + self.j_offset) * self.ntheta + self.theta_offset
+
+        self.visited = np.zeros(size, dtype=bool)
+        self.cost_to_come = np.full(size, np.inf)
+        self.cost = np.full(size, np.inf)
+        # Node pool ID of the state held by each bin, -1 when not reached
+        self.node = np.full(size, -1, dtype=np.int32)
+
+    @staticmethod
+    def nbytes(width, height, distance_threshold, angular_threshold):
+        """Memory of the tables of a whole map (bytes)"""
+        size = ((adjust(width, distance_threshold) + 1) * (adjust(height, distance_threshold) + 1)
+                * (2*(adjust(180, angular_threshold) + 1) + 1))
+        # visited, cost_to_come, cost and node
+        return size * (1 + 8 + 8 + 4)
+
+    def key(self, x, y, theta):
+        """Return the flat state ID of a state"""
+        return ((adjust(x, self.distance_threshold) * self.ny + adjust(y, self.distance_threshold)) * self.ntheta
+                + adjust(theta, self.angular_threshold) + self.key_offset)
+
+    def is_visited(self, key):
+        return self.visited[key]
+
+    def keys(self, x, y, theta):
+        """Return the flat state IDs of arrays of states"""
+        # Casting to integers truncates towards zero like int() in adjust()
+        x_vis = ((np.rint(x*2)/2).astype(np.int64) / self.distance_threshold).astype(np.int64)
+        y_vis = ((np.rint(y*2)/2).astype(np.int64) / self.distance_threshold).astype(np.int64)
+        theta_vis = ((np.rint(theta*2)/2).astype(np.int64) / self.angular_threshold).astype(np.int64)
+        return (x_vis * self.ny + y_vis) * self.ntheta + theta_vis + self.key_offset
+
+
+class NodePool:
+    """
+    Nodes of a search as a struct of arrays, addressed by integer IDs in the order they were added
+    Holds the x, y, theta, parent ID, cost to come and action index of every node in preallocated arrays,
+    which double when full. A start node is its own parent and has action -1 (no inputs).
+    """
+
+    def __init__(self, capacity=1024):
+        self.x = np.empty(capacity)
+        self.y = np.empty(capacity)
+        self.theta = np.empty(capacity)
+        self.parent = np.empty(capacity, dtype=np.int32)
+        self.cost = np.empty(capacity)
+        self.action = np.empty(capacity, dtype=np.int8)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, x, y, theta, parent, cost, action):
+        """Append a node and return its ID, parent None makes it its own parent"""
+        node = self.size
+        if node == len(self.x):
+            for name in ('x', 'y', 'theta', 'parent', 'cost', 'action'):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.empty_like(array)]))
+        self.size += 1
+        self.set(node, x, y, theta, node if parent is None else parent, cost, action)
+        return node
+
+    def set(self, node, x, y, theta, parent, cost, action):
+        """Write the values of a node"""
+        self.x[node] = x
+        self.y[node] = y
+        self.theta[node] = theta
+        self.parent[node] = parent
+        self.cost[node] = cost
+        self.action[node] = action
+
+    def state(self, node):
+        """(x, y, theta) of a node as Python floats"""
+        return float(self.x[node]), float(self.y[node]), float(self.theta[node])
+
+    def inputs(self, node, action_set):
+        """Wheel rpm applied to reach a node, (0, 0) for a start node"""
+        action = self.action[node]
+        return (0, 0) if action < 0 else tuple(action_set[action])
+
+    def path(self, node, action_set):
+        """(x, y, theta, rpm_l, rpm_r) of the nodes from the start to a node, walking the parent IDs"""
+        nodes = [node]
+        while self.parent[node] != node:
+            node = int(self.parent[node])
+            nodes.append(node)
+        nodes.reverse()
+        return [self.state(node) + self.inputs(node, action_set) for node in nodes]
+
+
+class IndexedHeap:
+    """
+    Binary min heap of (priority, key) entries holding at most one entry per key
+    push() inserts a key or moves its entry to a new priority, so a bin never has stale entries in the open list
+    Ties are broken by the key, which keeps the order of expansions deterministic
+    """
+
+    def __init__(self):
+        self.heap = []
+        # Position of every key in the heap
+        self.index = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def push(self, key, priority):
+        """Insert a key, or update its priority when it is already in the heap, returns True when it was inserted"""
+        entry = (priority, key)
+        i = self.index.get(key)
+        if i is None:
+            self.heap.append(entry)
+            self._sift_up(len(self.heap)-1)
+            return True
+        old = self.heap[i]
+        self.heap[i] = entry
+        if entry < old:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+        return False
+
+    def pop(self):
+        """Remove and return the (priority, key) entry with the lowest priority"""
+        heap = self.heap
+        last = heap.pop()
+        if heap:
+            top = heap[0]
+            heap[0] = last
+            self._sift_down(0)
+        else:
+            top = last
+        del self.index[top[1]]
+        return top
+
+    def remove(self, key):
+        """Remove the entry of a key"""
+        heap = self.heap
+        i = self.index.pop(key)
+        last = heap.pop()
+        if i < len(heap):
+            old = heap[i]
+            heap[i] = last
+            self.index[last[1]] = i
+            if last < old:
+                self._sift_up(i)
+            else:
+                self._sift_down(i)
+
+    def top(self):
+        """Return the (priority, key) entry with the lowest priority without removing it"""
+        return self.heap[0]
+
+    def _sift_up(self, i):
+        heap, index = self.heap, self.index
+        entry = heap[i]
+        while i > 0:
+            j = (i-1) >> 1
+            above = heap[j]
+            if not entry < above:
+                break
+            heap[i] = above
+            index[above[1]] = i
+            i = j
+        heap[i] = entry
+        index[entry[1]] = i
+
+    def _sift_down(self, i):
+        heap, index = self.heap, self.index
+        n = len(heap)
+        entry = heap[i]
+        while True:
+            j = 2*i + 1
+            if j >= n:
+                break
+            # Pick the smaller child
+            if j+1 < n and heap[j+1] < heap[j]:
+                j += 1
+            below = heap[j]
+            if not below < entry:
+                break
+            heap[i] = below
+            index[below[1]] = i
+            i = j
+        heap[i] = entry
+        index[entry[1]] = i
+
+
+class EdgeBuffer:
+    """
+    Edges created by a search, recorded for visualization instead of integrating the actions again
+    Each row holds the (x, y, theta) an action starts from, the action index and the action cost,
+    so the sampled arc is looked up in the motion lattice up to the cost (astar_render.edge_polylines())
+    """
+
+    def __init__(self, capacity=4096):
+        self.rows = np.empty((capacity, 5), dtype=np.float32)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, x, y, theta, action, cost):
+        if self.size == len(self.rows):
+            # Double the capacity, so appending stays amortized constant time
+            self.rows = np.concatenate([self.rows, np.empty_like(self.rows)])
+        self.rows[self.size] = (x, y, theta, action, cost)
+        self.size += 1
+
+    def edges(self):
+        """(x, y, theta, action, cost) rows of the recorded edges"""
+        return self.rows[:self.size]
+
+
+def euler_successors(collision_map, action_set, T, wheel_radius, wheel_distance, stats, x, y, theta):
+    """Integrate every action from a node, returns (x, y, theta, distance, rpm_l, rpm_r) per action"""
+
+    grid, threshold = collision_map.grid, collision_map.threshold
+    perf_counter = time.perf_counter
+    successors = []
+    for rpm_l, rpm_r in action_set:
+
+        # Convert the rpm values to angular velocity
+        ul = 2 * np.pi * rpm_l / 60
+        ur = 2 * np.pi * rpm_r / 60
+
+        # Apply these velocities for t seconds to the model
+        t = 0
+        dt = 0.1
+        d = 0
+        x_new, y_new, theta_new = x, y, theta
+        # The integration steps are interleaved with the map lookups, so the whole loop is timed as collision checking
+        begin = perf_counter()
+        while t < T:
+            dx_dt = wheel_radius/2 * (ul + ur) * np.cos(np.radians(theta_new))
+            dy_dt = wheel_radius/2 * (ul + ur) * np.sin(np.radians(theta_new))
+            dtheta_dt = np.rad2deg(wheel_radius/wheel_distance * (ur - ul))
+
+            # Save the current state
+            x_prev, y_prev, theta_prev = x_new, y_new, theta_new
+
+            # Get the new state
+            x_new += dx_dt * dt
+            y_new += dy_dt * dt
+            theta_new += dtheta_dt * dt
+
+            # Check if the new state is in the obstacle space
+            stats.collision_checks += 1
+            if grid[int(round(y_new*2)/2), int(round(x_new*2)/2)] > threshold:
+                # Calculate the total distance travelled
+                d += np.sqrt( (dx_dt*dt)**2 + (dy_dt*dt)**2)
+                t += dt
+            # If the new state is in the obstacle space, revert to the previous state
+            else:
+                x_new, y_new, theta_new = x_prev, y_prev, theta_prev
+                break
+        stats.collision_time += perf_counter() - begin
+
+        successors.append((x_new, y_new, theta_new, d, rpm_l, rpm_r))
+
+    return successors
+
+
+def lattice_successors(collision_map, lattice, stats, x, y, theta):
+    """Look up every action from a node in the motion lattice, same output as euler_successors()"""
+
+    grid, threshold = collision_map.grid, collision_map.threshold
+    perf_counter = time.perf_counter
+    successors = []
+    primitives = lattice.primitives[lattice.heading_index(theta)]
+    for (rpm_l, rpm_r), samples in zip(lattice.action_set, primitives):
+        x_new, y_new, theta_new, d = x, y, theta, 0
+        # The sample loop is almost only map lookups, so it is timed as a whole
+        begin = perf_counter()
+        for dx, dy, dtheta, arc in samples:
+            x_s, y_s = x + dx, y + dy
+            stats.collision_checks += 1
+            # Stop at the last sample before the obstacle space
+            if grid[int(round(y_s*2)/2), int(round(x_s*2)/2)] <= threshold:
+                break
+            x_new, y_new, theta_new, d = x_s, y_s, theta + dtheta, arc
+        stats.collision_time += perf_counter() - begin
+        successors.append((x_new, y_new, theta_new, d, rpm_l, rpm_r))
+
+    return successors
+
+
+def lattice_predecessors(collision_map, lattice, stats, x, y, theta):
+    """
+    States from which every action of the motion lattice ends at (x, y, theta), same output as lattice_successors()
+    An action is skipped unless all of its samples are in free space, as it cannot be cut short when reversed
+    """
+
+    grid, threshold = collision_map.grid, collision_map.threshold
+    perf_counter = time.perf_counter
+    predecessors = []
+    for a, (rpm_l, rpm_r) in enumerate(lattice.action_set):
+        # The heading change of an action does not depend on the heading it starts from
+        theta_prev = theta - lattice.dtheta[a, -1]
+        samples = lattice.primitives[lattice.heading_index(theta_prev)][a]
+        dx_end, dy_end, _, arc = samples[-1]
+        x_prev, y_prev = x - dx_end, y - dy_end
+        begin = perf_counter()
+        for dx, dy, _, _ in samples:
+            x_s, y_s = x_prev + dx, y_prev + dy
+            stats.collision_checks += 1
+            if grid[int(round(y_s*2)/2), int(round(x_s*2)/2)] <= threshold:
+                break
+        else:
+            predecessors.append((x_prev, y_prev, theta_prev, arc, rpm_l, rpm_r))
+        stats.collision_time += perf_counter() - begin
+
+    return predecessors
+
+
+def euler_samples(action_set, T, wheel_radius, wheel_distance, theta):
+    """Integrate all actions at once, returns the (dx, dy, dtheta, distance) samples with shape (actions, steps)"""
+
+    rpm = np.array(action_set, dtype=float)
+    ul = 2 * np.pi * rpm[:, 0] / 60
+    ur = 2 * np.pi * rpm[:, 1] / 60
+    dtheta_dt = np.rad2deg(wheel_radius/wheel_distance * (ur - ul))
+
+    dx, dy, dtheta, d = [], [], [], []
+    x_new = y_new = d_new = np.zeros(len(action_set))
+    theta_new = np.full(len(action_set), float(theta))
+    t = 0
+    dt = 0.1
+    while t < T:
+        dx_dt = wheel_radius/2 * (ul + ur) * np.cos(np.radians(theta_new))
+        dy_dt = wheel_radius/2 * (ul + ur) * np.sin(np.radians(theta_new))
+        x_new = x_new + dx_dt * dt
+        y_new = y_new + dy_dt * dt
+        theta_new = theta_new + dtheta_dt * dt
+        d_new = d_new + np.sqrt((dx_dt*dt)**2 + (dy_dt*dt)**2)
+        dx.append(x_new)
+        dy.append(y_new)
+        dtheta.append(theta_new - theta)
+        d.append(d_new)
+        t += dt
+
+    return np.stack(dx, 1), np.stack(dy, 1), np.stack(dtheta, 1), np.stack(d, 1)
+
+
+def batch_successors(collision_map, action_set, T, wheel_radius, wheel_distance, lattice, clearance, table, stats,
+                     x, y, theta):
+    """
+    Generate the children of a node for all actions at once
+    The samples of every action are checked in a single lookup of the flattened collision map
+    Returns arrays (x, y, theta, action cost, state ID, action index) of the children in free space
+    """
+
+    grid, threshold = collision_map.flat, collision_map.threshold
+    width, height = collision_map.width, collision_map.height
+
+    # Sample offsets of every action, shape (actions, steps)
+    if lattice is None:
+        dx, dy, dtheta, d = euler_samples(action_set, T, wheel_radius, wheel_distance, theta)
+    else:
+        h = lattice.heading_index(theta)
+        dx, dy, dtheta, d = lattice.dx[h], lattice.dy[h], lattice.dtheta, lattice.arc
+
+    # Check every sample against the map at once
+    # Out of range indices are clipped onto the border of the map, so they count as obstacles
+    x_s = x + dx
+    y_s = y + dy
+    cells = (np.rint(y_s*2)/2).astype(np.int64) * width + (np.rint(x_s*2)/2).astype(np.int64)
+    begin = time.perf_counter()
+    free = grid.take(cells, mode='clip') > threshold
+    stats.collision_time += time.perf_counter() - begin
+    stats.collision_checks += free.size
+
+    # Each action stops at the last sample before the obstacle space
+    n_free = free.cumprod(axis=1).sum(axis=1)
+    actions = n_free.nonzero()[0]
+    last = n_free[actions] - 1
+
+    x_new = x_s[actions, last]
+    y_new = y_s[actions, last]
+    theta_new = theta + dtheta[actions, last]
+    action_cost = d[actions, last].astype(np.int64)
+
+    # Keep the heading angle within 180 and -180
+    theta_new[theta_new > 180] -= 360
+    theta_new[theta_new < -180] += 360
+
+    # Cap the new node values within the boundaries of the canvas
+    x_new = np.minimum(np.maximum(x_new, clearance), width-clearance)
+    y_new = np.minimum(np.maximum(y_new, clearance), height-clearance)
+
+    # Check if the new nodes are in the free space
+    cells = (np.rint(y_new*2)/2).astype(np.int64) * width + (np.rint(x_new*2)/2).astype(np.int64)
+    begin = time.perf_counter()
+    inside = grid.take(cells, mode='clip') > threshold
+    stats.collision_time += time.perf_counter() - begin
+    stats.collision_checks += inside.size
+
+    x_new, y_new, theta_new = x_new[inside], y_new[inside], theta_new[inside]
+    return x_new, y_new, theta_new, action_cost[inside], table.keys(x_new, y_new, theta_new), actions[inside]
+
+
+def kernel_successors(collision_map, action_set, T, wheel_radius, wheel_distance, lattice, clearance, table, stats,
+                      x, y, theta):
+    """Same children as batch_successors(), generated by the compiled kernel of astar_kernel"""
+
+    if lattice is None:
+        dx, dy, dtheta, d = euler_samples(action_set, T, wheel_radius, wheel_distance, theta)
+    else:
+        h = lattice.heading_index(theta)
+        dx, dy, dtheta, d = lattice.dx[h], lattice.dy[h], lattice.dtheta, lattice.arc
+
+    x_new, y_new, theta_new, action_cost, new_keys, actions, checks = astar_kernel.expand(
+        collision_map.flat, collision_map.width, collision_map.height, collision_map.threshold, clearance,
+        x, y, theta, dx, dy, dtheta, d, table.distance_threshold, table.angular_threshold,
+        table.ny, table.ntheta, table.key_offset)
+    # The collision checks run inside the kernel, so their time is only counted in the expansion time
+    stats.collision_checks += checks
+    return x_new, y_new, theta_new, action_cost, new_keys, actions
+
+
+def arc_shot(collision_map, x, y, theta, goal, wheel_distance, resolution=1, coarse_resolution=16):
+    """
+    Single arc from (x, y, theta) to the goal (x, y), tangent to the heading, checked for collisions every
+    resolution (mm) or less. Most shots cross an obstacle, so the arc is first checked every coarse_resolution (mm)
+    and only arcs passing that are sampled densely
+    Returns (arc length, heading at the goal, curvature (rad/mm), sample x, sample y, collision checks),
+    None and the collision checks when the arc turns more than half a turn, needs a wheel to run backwards
+    or crosses the obstacle space
+    """
+
+    dx, dy = goal[0] - x, goal[1] - y
+    chord = dist((x, y), goal[:2])
+    if chord < resolution:
+        return None, 0
+
+    # The arc turns twice the angle between the heading and the chord
+    alpha = radians((degrees(atan2(dy, dx)) - theta + 180) % 360 - 180)
+    if abs(alpha) >= np.pi/2:
+        return None, 0
+    length = chord * alpha / sin(alpha) if alpha != 0 else chord
+    curvature = 2 * alpha / length
+    if abs(curvature) * wheel_distance/2 > 1:
+        return None, 0
+
+    def samples(n):
+        # Same closed form chords as the 'arc' motion model of the lattice, n samples ending at the goal
+        arc = length * np.arange(1, n + 1) / n
+        turn = curvature * arc
+        chords = arc * np.sinc(turn / (2 * np.pi))
+        direction = radians(theta) + turn / 2
+        return x + chords * np.cos(direction), y + chords * np.sin(direction)
+
+    checks = 0
+    if coarse_resolution > resolution:
+        n_coarse = max(1, ceil(length / coarse_resolution))
+        checks += n_coarse
+        if not collision_map.all_free(*samples(n_coarse)):
+            return None, checks
+
+    n = max(1, ceil(length / resolution))
+    xs, ys = samples(n)
+    checks += n
+    if not collision_map.all_free(xs, ys):
+        return None, checks
+
+    theta_goal = (theta + degrees(2 * alpha) + 180) % 360 - 180
+    return (length, theta_goal, curvature, xs, ys), checks
+
+
+@dataclass
+class PlannerParams:
+    """Parameters of a plan, the defaults are the ones of the ROS node"""
+    rpm1: float = 50 #rpm
+    rpm2: float = 100 #rpm
+    T: float = 0.3 #s
+    clearance: float = 10 + ROBOT_RADIUS #mm
+    distance_threshold: float = 20 #mm
+    angular_threshold: float = 30 #deg
+    wheel_radius: float = WHEEL_RADIUS #mm
+    wheel_distance: float = WHEEL_DISTANCE #mm
+    # State tables used by the search, 'array' or 'dict'
+    engine: str = 'array'
+    # Look up the precomputed motion primitives instead of integrating them at every node
+    lattice: bool = True
+    # Integration of the actions in the lattice, 'euler' for the Euler steps of the original planner,
+    # or 'arc' for the exact arc of the wheel speeds, checked for collisions every arc_resolution along the way
+    motion_model: str = 'euler'
+    arc_resolution: float = 1 #mm
+    # Generate the children of a node for all actions at once
+    batched: bool = True
+    # Generate the batched children with the compiled kernel of astar_kernel, when Numba is installed
+    jit: bool = False
+    # Cost to go estimate, 'euclidean' for the straight line distance or 'dijkstra' for the distance around obstacles
+    heuristic: str = 'euclidean'
+    # Cell size of the coarse map searched by the 'dijkstra' heuristic
+    heuristic_resolution: int = 50 #mm
+    # Inflation of the heuristic, above 1 trades path cost for fewer expansions (weighted A*)
+    weight: float = 1
+    # Search from both ends and meet in the middle, it needs the motion lattice
+    bidirectional: bool = False
+    # Plan a corridor with a grid A* on a coarse map first, and keep the lattice search inside it
+    hierarchical: bool = False
+    # Goal region, within goal_tolerance of the goal and, for a goal (x, y, theta), within heading_tolerance of its
+    # heading
+    goal_tolerance: float = 10 #mm
+    heading_tolerance: float = 180 #deg
+    # Try to reach the goal with a single collision checked arc from every shot_interval-th expanded node, 0 disables it
+    shot_interval: int = 0
+    # Double the duration of the actions, up to max_T, where the clearance keeps the longer actions in free space.
+    # It needs a distance field collision map, with other maps every action lasts T
+    adaptive: bool = False
+    max_T: float = 2.4 #s
+    # Cell size of the coarse map and distance from the coarse path covered by the corridor
+    corridor_resolution: int = 25 #mm
+    corridor_width: float = 200 #mm
+
+    @property
+    def action_set(self):
+        rpm1, rpm2 = self.rpm1, self.rpm2
+        return [(0, rpm1), (rpm1, 0), (rpm1, rpm1), (0, rpm2),
+                (rpm2, 0), (rpm2, rpm2), (rpm1, rpm2), (rpm2, rpm1)]
+
+
+@dataclass
+class SearchStats:
+    """Counters and phase timings of a search"""
+    # Nodes popped from the open list and expanded
+    expansions: int = 0
+    heap_pushes: int = 0
+    # Samples looked up in the collision map
+    collision_checks: int = 0
+    # Successors in the obstacle space or not cheaper than their bin
+    rejected: int = 0
+    # Arcs to the goal tried, and the ones that gave a cheaper path
+    shots: int = 0
+    shots_taken: int = 0
+    # Bins in the open list whose key was lowered
+    decreased: int = 0
+    # Expanded bins reached again with a lower cost and put back in the open list
+    reopened: int = 0
+    peak_open: int = 0
+    # Bins reached by the search
+    nodes: int = 0
+    time: float = 0 #s
+    # Time generating successors (including the collision checks), checking collisions and in the heap
+    expand_time: float = 0 #s
+    collision_time: float = 0 #s
+    heap_time: float = 0 #s
+
+    def as_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class PlanResult:
+    """
+    Outcome of plan(), all positions are in canvas coordinates (top left as origin)
+    path holds (x, y, theta, rpm_l, rpm_r) from the start to the achieved node, with the inputs that reach each point
+    cost is the cost to come of the achieved node (mm travelled), inf when the goal was not reached
+    nodes is the NodePool of the (forward) search, None when the plan was not searched
+    """
+    reached: bool
+    path: list
+    inputs: list
+    cost: float
+    stats: SearchStats
+    nodes: NodePool = field(repr=False)
+    # Heuristic weight bounding the path, its cost is within this factor of the optimal one, inf for a path found
+    # by a shot before the first search of plan_anytime() finished
+    weight: float = 1
+
+
+def _pad_bounds(bounds, collision_map, action_set, T, wheel_radius, lattice, adaptive, distance_threshold):
+    """
+    Grow the region of the states an AStarSearch keeps by the farthest an action reaches, and a bin,
+    so the children of those states are inside it too
+    """
+    if adaptive is not None:
+        reach = max(adaptive.reach)
+    elif lattice is not None:
+        reach = float(np.hypot(lattice.dx, lattice.dy).max(initial=0))
+    else:
+        # The Euler steps run for up to one more step of 0.1 s than T
+        rpm_max = max(max(abs(rpm_l), abs(rpm_r)) for rpm_l, rpm_r in action_set)
+        reach = wheel_radius * 2 * np.pi * rpm_max / 60 * (T + 0.1)
+    pad = ceil(reach) + 1 + distance_threshold
+    x_min, y_min, x_max, y_max = bounds
+    return (max(0, x_min - pad), max(0, y_min - pad),
+            min(collision_map.width, x_max + pad), min(collision_map.height, y_max + pad))
+
+
+class AStarSearch:
+    """
+    A* from start states (x, y, theta) to goal (x, y) or (x, y, theta) in canvas coordinates, on an astar_map.CollisionMap
+    engine selects the state tables, 'array' for dense arrays or 'dict' for dictionaries
+    bounds (x_min, y_min, x_max, y_max) limits the 'array' tables to a region holding every state the heuristic
+    does not prune, such as the bounding box of a corridor
+    lattice is an optional MotionLattice of action_set and T, which replaces the Euler integration by table lookups
+    batched generates all the children of a node with array operations, it needs the 'array' engine
+    jit generates them with the compiled kernel instead, falling back to the array operations without Numba
+    adaptive is an optional AdaptiveLattice, whose longer actions replace those of lattice where the distance field
+    of the collision map leaves room for them, it needs batched successors. Nodes then store the action index
+    of the adaptive lattice, so paths still hold the wheel rpm of every action
+    stats is an optional SearchStats filled with the counters and phase timings of the search
+    heuristic(x, y) estimates the cost to go, defaults to the straight line distance, states where it is inf are pruned
+    weight inflates the heuristic, trading path cost for fewer expansions
+    reverse searches backwards through the lattice, from the states the actions end at to the ones they start from,
+    goal is then usually None, which disables the goal test so the search only grows a tree of costs to its starts
+    edges is an optional EdgeBuffer recording every edge that improves a bin, for visualization
+    The goal region is within goal_tolerance (mm) of the goal and, when the goal has a heading, within
+    heading_tolerance (degrees) of it
+    shot_interval > 0 tries an arc_shot() to the goal from every shot_interval-th expanded node, sampled every
+    shot_resolution (mm). A shot cheaper than the best path becomes the best path, and the search ends once no node
+    left can beat it, which cuts the expansions spent circling the goal region
+
+    The open list holds one entry per (x, y, theta) bin, keyed by its state ID. A bin reached with a lower cost
+    takes the new state, its entry is moved in the open list, or put back in it when the bin was already expanded.
+    nodes is a NodePool holding a node per improvement of a bin (table.node maps state IDs to the latest), with its
+    (x, y, theta), parent node and the action applied to reach it (applied at the bin to reach its parent when
+    searching in reverse).
+    The search state is kept between calls of improve(), so set_weight() can lower the weight and continue (ARA*)
+    """
+
+    def __init__(self, collision_map, starts, goal, action_set, clearance, distance_threshold, angular_threshold, T,
+                 wheel_radius, wheel_distance, engine='array', lattice=None, batched=False, stats=None,
+                 heuristic=None, weight=1, reverse=False, edges=None, jit=False, goal_tolerance=10,
+                 heading_tolerance=180, shot_interval=0, shot_resolution=1, adaptive=None, bounds=None):
+
+        if engine == 'array':
+            if bounds is not None:
+                bounds = _pad_bounds(bounds, collision_map, action_set, T, wheel_radius, lattice, adaptive,
+                                     distance_threshold)
+            self.table = ArrayStateTable(collision_map.width, collision_map.height, distance_threshold, angular_threshold,
+                                         bounds)
+        elif engine == 'dict':
+            self.table = DictStateTable(distance_threshold, angular_threshold)
+        else:
+            raise ValueError(f'Unknown engine: {engine}')
+        if batched and engine != 'array':
+            raise ValueError('Batched successors need the array engine')
+        if jit and not batched:
+            raise ValueError('The compiled kernel generates batched successors')
+        if reverse and lattice is None:
+            raise ValueError('Reverse search needs the motion lattice')
+        if adaptive is not None and (not batched or reverse):
+            raise ValueError('Adaptive action durations need batched forward successors')
+
+        self.collision_map = collision_map
+        self.starts, self.goal = starts, goal
+        # Actions of the successors, and of the action indexes stored in the nodes
+        self.actions = action_set
+        self.action_set = action_set if adaptive is None else adaptive.action_set
+        self.adaptive = adaptive
+        self.clearance = clearance
+        self.T = T
+        self.wheel_radius, self.wheel_distance = wheel_radius, wheel_distance
+        self.lattice = lattice
+        # Predecessors are generated one at a time
+        self.batched = batched and not reverse
+        self.batch_successors = kernel_successors if jit and astar_kernel.AVAILABLE else batch_successors
+        self.reverse = reverse
+        self.stats = SearchStats() if stats is None else stats
+        self.heuristic = astar_heuristic.euclidean_heuristic(goal) if heuristic is None else heuristic
+        self.weight = weight
+        self.reopen = True
+        self.edges = edges
+        self.action_index = {action: a for a, action in enumerate(action_set)}
+        self.goal_tolerance, self.heading_tolerance = goal_tolerance, heading_tolerance
+        self.shot_interval, self.shot_resolution = shot_interval, shot_resolution
+
+        # Best goal state found so far and its cost to come
+        # achieved is its bin, or the bin a shot left from, shot_path then holds the whole path
+        self.reached = False
+        self.achieved = None
+        self.cost = np.inf
+        self.shot_path = None
+
+        # Bins expanded since the weight was last set, and bins improved after their expansion,
+        # which wait for the next weight instead of being expanded again (ARA*)
+        self.closed = set()
+        self.inconsistent = set()
+
+        self.nodes = NodePool()
+        self.open = IndexedHeap()
+        for x_start, y_start, theta_start in starts:
+            start_key = self.table.key(x_start, y_start, theta_start)
+            self.table.node[start_key] = self.nodes.add(x_start, y_start, theta_start, None, 0, -1)
+            start_cost = weight * self.heuristic(x_start, y_start)
+            self.table.visit(start_key, 0, start_cost)
+            self.open.push(start_key, start_cost)
+            self.stats.heap_pushes += 1
+        self.stats.peak_open = max(self.stats.peak_open, len(self.open))
+
+    def set_weight(self, weight):
+        """Lower the heuristic weight, the bins improved after their expansion are put back in the open list"""
+        self.weight = weight
+        table, nodes, heuristic = self.table, self.nodes, self.heuristic
+        keys = [key for _, key in self.open.heap] + list(self.inconsistent)
+        self.open = IndexedHeap()
+        for key in keys:
+            x, y, _ = nodes.state(table.node[key])
+            cost = table.cost_to_come[key] + weight * heuristic(x, y)
+            table.cost[key] = cost
+            self.open.push(key, cost)
+        self.closed.clear()
+        self.inconsistent.clear()
+
+    def improve(self, deadline=None, reopen=True, cancel=None):
+        """
+        Expand nodes until a goal state cheaper than the best one is reached, or the open list is empty
+        reopen puts bins improved after their expansion back in the open list, otherwise they wait for set_weight()
+        Returns False when stopped by the deadline (time.perf_counter() value) or by setting cancel (threading.Event)
+        before finishing
+        """
+        self.reopen = reopen
+        q = self.open
+        perf_counter = time.perf_counter
+        while q:
+            if deadline is not None and perf_counter() > deadline:
+                return False
+            if cancel is not None and cancel.is_set():
+                return False
+            # The best goal state is no worse than any node left to expand
+            if self.reached and q.heap[0][0] >= self.cost:
+                return True
+            if self.step():
+                return True
+        return True
+
+    def min_cost(self):
+        """Lowest cost (cost to come plus weighted heuristic) in the open list, inf when it is empty"""
+        return self.open.heap[0][0] if self.open else np.inf
+
+    def step(self):
+        """Pop the best node and expand it, returns True when it is in the goal region instead"""
+
+        collision_map = self.collision_map
+        action_set, clearance = self.actions, self.clearance
+        table, stats = self.table, self.stats
+        q = self.open
+        perf_counter = time.perf_counter
+        cost_to_come = table.cost_to_come
+        relax = self._relax
+
+        begin = perf_counter()
+        _, current_key = q.pop()
+        stats.heap_time += perf_counter() - begin
+        stats.expansions += 1
+        self.closed.add(current_key)
+        self.current_key = current_key
+
+        # Get the state and cost to come of the current node
+        self.current_node = int(table.node[current_key])
+        x, y, theta = self.nodes.state(self.current_node)
+        c2c = cost_to_come[current_key]
+
+        goal = self.goal
+        if goal is not None:
+            if self.in_goal_region(x, y, theta):
+                self.reached, self.achieved, self.cost, self.shot_path = True, current_key, float(c2c), None
+                return True
+            if self.shot_interval and stats.expansions % self.shot_interval == 0:
+                self._shoot(current_key, x, y, theta, c2c)
+
+        if self.batched:
+            begin = perf_counter()
+            lattice, offset = self.lattice, 0
+            if self.adaptive is not None:
+                # Distance from the node to the obstacle space, which the longer actions must stay within
+                level = self.adaptive.level(
+                    collision_map.grid[int(round(y*2)/2), int(round(x*2)/2)] - collision_map.threshold)
+                lattice, offset = self.adaptive.levels[level], level * len(action_set)
+            x_new, y_new, theta_new, action_cost, new_keys, actions = self.batch_successors(
+                collision_map, action_set, self.T, self.wheel_radius, self.wheel_distance, lattice, clearance,
+                table, stats, x, y, theta)
+            stats.expand_time += perf_counter() - begin
+
+            # Keep the children that are not visited or are reached with a lower cost
+            new_c2c = c2c + action_cost
+            improved = ~table.visited[new_keys] | (cost_to_come[new_keys] > new_c2c)
+            stats.rejected += len(action_set)
+            if not improved.any():
+                return False
+
+            for x_new, y_new, theta_new, new_c2c, new_key, action in zip(
+                    x_new[improved].tolist(), y_new[improved].tolist(), theta_new[improved].tolist(),
+                    new_c2c[improved].tolist(), new_keys[improved].tolist(), actions[improved].tolist()):
+                # Children of the same batch may share a bin, so check again in order
+                if ((not table.visited[new_key] or cost_to_come[new_key] > new_c2c)
+                        and relax(current_key, new_key, x_new, y_new, theta_new, new_c2c, offset + action)):
+                    stats.rejected -= 1
+            stats.peak_open = max(stats.peak_open, len(q))
+            return False
+
+        begin = perf_counter()
+        if self.reverse:
+            children = lattice_predecessors(collision_map, self.lattice, stats, x, y, theta)
+        elif self.lattice is not None:
+            children = lattice_successors(collision_map, self.lattice, stats, x, y, theta)
+        else:
+            children = euler_successors(collision_map, action_set, self.T, self.wheel_radius, self.wheel_distance,
+                                        stats, x, y, theta)
+        stats.expand_time += perf_counter() - begin
+
+        width, height = collision_map.width, collision_map.height
+        grid, threshold = collision_map.grid, collision_map.threshold
+        key = table.key
+
+        for x_new, y_new, theta_new, d, rpm_l, rpm_r in children:
+
+            # Let the action cost be a function of distance travelled
+            action_cost = int(d)
+
+            # Keep the heading angle within 180 and -180
+            if theta_new > 180:
+                theta_new -= 360
+            elif theta_new < -180:
+                theta_new += 360
+
+            # Cap the new node values within the boundaries of the canvas
+            x_new = max(clearance, min(width-clearance, x_new))
+            y_new = max(clearance, min(height-clearance, y_new))
+
+            # Adjust the values for the canvas
+            x_cvs = int(round(x_new*2)/2)
+            y_cvs = int(round(y_new*2)/2)
+            theta_cvs = int(round(theta_new*2)/2)
+
+            # Check if the new node is within the boundaries of the canvas
+            if 0 <= x_new < width and 0 <= y_new < height and grid[y_cvs, x_cvs] > threshold:
+
+                # Bin of the new node in the state tables
+                new_key = key(x_new, y_new, theta_cvs)
+                new_c2c = c2c + action_cost
+
+                # Check if the new node is not visited, or if the new cost is less than the previous cost
+                if ((not table.is_visited(new_key) or cost_to_come[new_key] > new_c2c)
+                        and relax(current_key, new_key, x_new, y_new, theta_new, new_c2c,
+                                  self.action_index[(rpm_l, rpm_r)])):
+                    continue
+
+            stats.rejected += 1
+
+        stats.peak_open = max(stats.peak_open, len(q))
+        return False
+
+    def in_goal_region(self, x, y, theta):
+        goal = self.goal
+        if dist((x, y), goal[:2]) >= self.goal_tolerance:
+            return False
+        return len(goal) < 3 or abs((theta - goal[2] + 180) % 360 - 180) <= self.heading_tolerance
+
+    def _shoot(self, current_key, x, y, theta, c2c):
+        """Try an arc from the current node to the goal, it becomes the best path when it is cheaper"""
+        goal, stats = self.goal, self.stats
+        # Even a straight line would not be cheaper
+        if c2c + dist((x, y), goal[:2]) >= self.cost:
+            return
+        stats.shots += 1
+        shot, checks = arc_shot(self.collision_map, x, y, theta, goal, self.wheel_distance, self.shot_resolution)
+        stats.collision_checks += checks
+        if shot is None:
+            return
+        length, theta_goal, curvature, xs, ys = shot
+        if len(goal) > 2 and abs((theta_goal - goal[2] + 180) % 360 - 180) > self.heading_tolerance:
+            return
+        if c2c + length >= self.cost:
+            return
+
+        # Wheel speeds of the curvature, the faster wheel at the highest speed of the action set
+        rpm_max = max(max(abs(rpm_l), abs(rpm_r)) for rpm_l, rpm_r in self.action_set)
+        ratio_l, ratio_r = 1 - curvature * self.wheel_distance/2, 1 + curvature * self.wheel_distance/2
+        rpm_l = rpm_max * ratio_l / max(ratio_l, ratio_r)
+        rpm_r = rpm_max * ratio_r / max(ratio_l, ratio_r)
+
+        # Points along the arc no farther apart than the longest action, so the path can be followed point by point
+        step = max(self.wheel_radius * 2 * np.pi * rpm_max / 60 * self.T, self.shot_resolution)
+        n, m = len(xs), ceil(length / step)
+        points = (np.ceil(np.arange(1, m + 1) * n / m) - 1).astype(int)
+        turn = curvature * length * (points + 1) / n
+        path = self.nodes.path(self.current_node, self.action_set)
+        for point, dtheta in zip(points.tolist(), turn.tolist()):
+            path.append((float(xs[point]), float(ys[point]), (theta + degrees(dtheta) + 180) % 360 - 180, rpm_l, rpm_r))
+
+        stats.shots_taken += 1
+        self.reached, self.achieved, self.cost, self.shot_path = True, current_key, float(c2c + length), path
+
+    def _relax(self, parent_key, new_key, x_new, y_new, theta_new, new_c2c, action_index):
+        """
+        Store a bin reached with a lower cost and insert or move its entry in the open list, False when pruned
+        action_index is the index in self.action_set of the action reaching the bin
+        """
+        h = self.heuristic(x_new, y_new)
+        # The goal cannot be reached from this state
+        if h == np.inf:
+            return False
+        table, stats, nodes = self.table, self.stats, self.nodes
+        parent_node = self.current_node
+        if self.edges is not None:
+            # Actions run from the parent, or from the new state when searching in reverse
+            x, y, theta = (x_new, y_new, theta_new) if self.reverse else nodes.state(parent_node)
+            self.edges.add(x, y, theta, action_index, new_c2c - table.cost_to_come[parent_key])
+        new_cost = new_c2c + self.weight * h
+        was_visited = table.is_visited(new_key)
+        # Store the state, parent and action applied to the bin in a new node, even when the bin has one:
+        # children already generated from the old state keep it as their parent, so their paths stay connected
+        table.node[new_key] = nodes.add(x_new, y_new, theta_new, parent_node, new_c2c, action_index)
+        table.visit(new_key, new_c2c, new_cost)
+        if not self.reopen and new_key in self.closed:
+            self.inconsistent.add(new_key)
+            return True
+        begin = time.perf_counter()
+        inserted = self.open.push(new_key, new_cost)
+        stats.heap_time += time.perf_counter() - begin
+        if inserted:
+            stats.heap_pushes += 1
+            if was_visited:
+                stats.reopened += 1
+        else:
+            stats.decreased += 1
+        return True
+
+    def path(self):
+        """(x, y, theta, rpm_l, rpm_r) from the start to the best goal state, empty when the goal was not reached"""
+        if not self.reached:
+            return []
+        if self.shot_path is not None:
+            return list(self.shot_path)
+        return self.nodes.path(int(self.table.node[self.achieved]), self.action_set)
+
+    def result(self):
+        """PlanResult of the best goal state found so far"""
+        path = self.path()
+        return PlanResult(self.reached, path, [(rpm_l, rpm_r) for *_, rpm_l, rpm_r in path], self.cost,
+                          replace(self.stats), self.nodes, self.weight)
+
+
+class BidirectionalSearch:
+    """
+    Forward search from the start and reverse search from the goal, meeting on (x, y, theta) bins
+    The reverse search starts from the goal at every heading of the goal region.
+    The side with the smaller open list is expanded, and the best meeting (or goal state of the forward search)
+    is kept until its cost is no more than the lowest cost left in either open list
+    The states of the two searches in the meeting bin differ by up to the bin size, so a path through a meeting
+    steps straight from one to the other there. A meeting whose step crosses the obstacle space is skipped,
+    and the length of the step is part of the cost
+    """
+
+    def __init__(self, forward, backward):
+        self.forward, self.backward = forward, backward
+        self.stats = forward.stats
+        self.reached = False
+        self.cost = np.inf
+        # Meeting bin, or goal state of the forward search
+        self.meeting = None
+
+    def improve(self, deadline=None, cancel=None):
+        """Search until the best meeting cannot be improved, returns False when stopped by the deadline or cancel"""
+
+        forward, backward = self.forward, self.backward
+        perf_counter = time.perf_counter
+
+        while forward.open and backward.open:
+            if deadline is not None and perf_counter() > deadline:
+                return False
+            if cancel is not None and cancel.is_set():
+                return False
+            if self.cost <= max(forward.min_cost(), backward.min_cost()):
+                break
+
+            if len(forward.open) <= len(backward.open):
+                side, other = forward, backward
+            else:
+                side, other = backward, forward
+
+            side.step()
+            # Only the forward search has a goal region, reached by the expanded node or by a shot from it
+            if side.cost < self.cost:
+                self.reached, self.cost, self.meeting = True, side.cost, side.achieved
+                continue
+
+            key = side.current_key
+            if other.table.is_visited(key):
+                cost = self._meeting_cost(key)
+                if cost < self.cost:
+                    self.reached, self.cost, self.meeting = True, cost, key
+
+        return True
+
+    def _meeting_cost(self, key):
+        """Cost of the path through a meeting bin, inf when the step between the two searches is blocked"""
+        forward, backward = self.forward, self.backward
+        x, y, _ = forward.nodes.state(int(forward.table.node[key]))
+        x_back, y_back, _ = backward.nodes.state(int(backward.table.node[key]))
+        # Samples of the step every mm or less, as the arcs of the lattice
+        length = dist((x, y), (x_back, y_back))
+        n = max(1, ceil(length))
+        t = np.arange(1, n + 1) / n
+        self.stats.collision_checks += n
+        if not forward.collision_map.all_free(x + (x_back - x) * t, y + (y_back - y) * t):
+            return np.inf
+        return float(forward.table.cost_to_come[key] + backward.table.cost_to_come[key] + length)
+
+    def path(self):
+        """(x, y, theta, rpm_l, rpm_r) from the start through the meeting bin to the goal"""
+
+        if not self.reached:
+            return []
+        forward, backward = self.forward, self.backward
+        if forward.reached and self.meeting == forward.achieved:
+            return forward.path()
+        path = forward.nodes.path(int(forward.table.node[self.meeting]), forward.action_set)
+
+        # Follow the reverse search to the goal, the inputs of a node lead to its parent
+        nodes = backward.nodes
+        node = int(backward.table.node[self.meeting])
+        while nodes.parent[node] != node:
+            next_node = int(nodes.parent[node])
+            path.append(nodes.state(next_node) + nodes.inputs(node, backward.action_set))
+            node = next_node
+        return path
+
+    def result(self):
+        """PlanResult of the best path found so far"""
+        path = self.path()
+        return PlanResult(self.reached, path, [(rpm_l, rpm_r) for *_, rpm_l, rpm_r in path], self.cost,
+                          replace(self.stats), self.forward.nodes)
+
+
+_distance_field = None
+
+
+def default_collision_map(clearance):
+    """Collision map of the competition world for a clearance, the distance field is loaded once per process"""
+    global _distance_field
+    if _distance_field is None:
+        _distance_field = astar_map.load_distance_field()
+    return astar_map.CollisionMap.from_distance_field(_distance_field, clearance)
+
+
+def make_heuristic(params, collision_map, goal):
+    """Build the cost to go estimate selected by params.heuristic"""
+    if params.heuristic == 'euclidean':
+        return astar_heuristic.euclidean_heuristic(goal)
+    if params.heuristic == 'dijkstra':
+        return astar_heuristic.DijkstraHeuristic(collision_map, goal, params.heuristic_resolution)
+    raise ValueError(f'Unknown heuristic: {params.heuristic}')
+
+
+def _prepare(start, goal, params, collision_map):
+    """Default the parameters and collision map, check the start and goal, and load the lattice"""
+
+    if params is None:
+        params = PlannerParams()
+    if collision_map is None:
+        collision_map = default_collision_map(params.clearance)
+
+    if not collision_map.is_free(start[0], start[1]):
+        raise ValueError(f'Start {start[:2]} is not in free space')
+    if not collision_map.is_free(goal[0], goal[1]):
+        raise ValueError(f'Goal {goal[:2]} is not in free space')
+
+    lattice = None
+    if params.lattice:
+        lattice = load_lattice(params)
+    elif params.motion_model != 'euler':
+        raise ValueError(f'The {params.motion_model} motion model needs the motion lattice')
+    return params, collision_map, lattice
+
+
+def load_lattice(params, T=None, arc_resolution=None):
+    """Motion lattice of the plan parameters, by default with actions lasting params.T, from the on-disk cache"""
+    return astar_lattice.load_lattice(params.action_set, params.T if T is None else T, params.wheel_radius,
+                                      params.wheel_distance, motion_model=params.motion_model,
+                                      arc_resolution=params.arc_resolution if arc_resolution is None else arc_resolution)
+
+
+def load_adaptive_lattice(params):
+    """
+    AdaptiveLattice of the plan parameters, its actions last T doubled up to max_T, only T unless params.adaptive
+    It also looks up the edges of any plan, for astar_render.edge_polylines()
+    """
+    durations = [params.T]
+    while params.adaptive and durations[-1] * 2 <= params.max_T + 1e-9:
+        durations.append(durations[-1] * 2)
+    # The longer actions are only taken where all their samples are in free space, so their arcs are sampled as
+    # sparsely as those of T rather than every arc_resolution
+    return astar_lattice.AdaptiveLattice([load_lattice(params, T, params.arc_resolution * T / params.T)
+                                          for T in durations])
+
+
+def _corridor(start, goal, params, collision_map):
+    """Corridor of a hierarchical plan, None when the plan is not hierarchical or the coarse map has no path"""
+    if not params.hierarchical:
+        return None
+    corridor = astar_corridor.Corridor(collision_map, start, goal, params.corridor_resolution, params.corridor_width)
+    return corridor if corridor.found else None
+
+
+def _search(start, goal, params, collision_map, lattice, stats, weight, corridor=None, edges=None):
+    """Set up an AStarSearch from the plan parameters, restricted to the corridor when there is one"""
+    heuristic = make_heuristic(params, collision_map, goal)
+    if corridor is not None:
+        heuristic = corridor.restrict(heuristic)
+    return AStarSearch(collision_map, [tuple(start)], tuple(goal), params.action_set, params.clearance,
+                       params.distance_threshold, params.angular_threshold, params.T,
+                       params.wheel_radius, params.wheel_distance, params.engine, lattice, params.batched, stats,
+                       heuristic, weight, edges=edges, jit=params.jit, goal_tolerance=params.goal_tolerance,
+                       heading_tolerance=params.heading_tolerance, shot_interval=params.shot_interval,
+                       shot_resolution=params.arc_resolution,
+                       adaptive=load_adaptive_lattice(params) if params.adaptive else None,
+                       bounds=corridor.bounds() if corridor is not None else None)
+
+
+def _reverse_search(start, goal, params, collision_map, lattice, stats, corridor=None, edges=None):
+    """Set up the reverse AStarSearch of a bidirectional plan, from the goal at every heading towards the start"""
+    if lattice is None:
+        raise ValueError('Bidirectional search needs the motion lattice')
+    heuristic = make_heuristic(params, collision_map, start)
+    if corridor is not None:
+        heuristic = corridor.restrict(heuristic)
+    headings = np.arange(-180, 180, params.angular_threshold)
+    if len(goal) > 2:
+        # Only the headings of the goal region, or the heading of the goal when the bins are wider than the tolerance
+        headings = headings[np.abs((headings - goal[2] + 180) % 360 - 180) <= params.heading_tolerance]
+        if len(headings) == 0:
+            headings = [goal[2]]
+    goals = [(goal[0], goal[1], float(theta)) for theta in headings]
+    return AStarSearch(collision_map, goals, None, params.action_set, params.clearance,
+                       params.distance_threshold, params.angular_threshold, params.T,
+                       params.wheel_radius, params.wheel_distance, params.engine, lattice, False, stats,
+                       heuristic, params.weight, reverse=True, edges=edges,
+                       bounds=corridor.bounds() if corridor is not None else None)
+
+
+def plan(start, goal, params=None, collision_map=None, cancel=None, edges=None):
+    """
+    Plan a path from start (x, y, theta) to goal (x, y) or (x, y, theta), in canvas coordinates (top left as origin)
+    collision_map defaults to the competition world with params.clearance
+    Setting cancel (threading.Event) from another thread stops the search, the result is then not reached
+    edges is an optional EdgeBuffer filled with the edges of the search, for visualization
+    Raises ValueError when the start or goal is not in free space
+    """
+
+    params, collision_map, lattice = _prepare(start, goal, params, collision_map)
+
+    stats = SearchStats()
+    begin = time.perf_counter()
+    corridor = _corridor(start, goal, params, collision_map)
+    # Search the corridor first, and the whole map if the lattice cannot follow it
+    for region in ([corridor, None] if corridor is not None else [None]):
+        search = _search(start, goal, params, collision_map, lattice, stats, params.weight, region, edges)
+        if params.bidirectional:
+            search = BidirectionalSearch(
+                search, _reverse_search(start, goal, params, collision_map, lattice, stats, region, edges))
+        finished = search.improve(cancel=cancel)
+        if search.reached or not finished:
+            break
+    stats.time = time.perf_counter() - begin
+    if params.bidirectional:
+        stats.nodes = len(search.forward.nodes) + len(search.backward.nodes)
+    else:
+        stats.nodes = len(search.nodes)
+
+    return search.result()
+
+
+def plan_anytime(start, goal, time_budget, params=None, collision_map=None, on_path=None, weights=ANYTIME_WEIGHTS,
+                 cancel=None, edges=None):
+    """
+    Anytime plan (ARA*), a fast first path with an inflated heuristic is improved with lower weights until time runs out
+    Each search reuses the state of the previous one, and on_path(result) is called with every improved path
+    time_budget (s) bounds the planning time, the last weight is usually 1 for a path as good as plan()
+    Setting cancel (threading.Event) from another thread stops planning like the end of the budget
+    edges is an optional EdgeBuffer filled with the edges of every search, for visualization
+    Returns the best PlanResult found, not reached when no path was found within the budget
+    """
+
+    params, collision_map, lattice = _prepare(start, goal, params, collision_map)
+    if params.bidirectional:
+        raise ValueError('The anytime planner does not support bidirectional search')
+
+    stats = SearchStats()
+    begin = time.perf_counter()
+    deadline = begin + time_budget
+    corridor = _corridor(start, goal, params, collision_map)
+    best = None
+
+    # Search the corridor first, and the whole map if the lattice cannot follow it
+    for region in ([corridor, None] if corridor is not None else [None]):
+        search = _search(start, goal, params, collision_map, lattice, stats, weights[0], region, edges)
+
+        for i, weight in enumerate(weights):
+            if i > 0:
+                search.set_weight(weight)
+            finished = search.improve(deadline, reopen=False, cancel=cancel)
+            stats.time = time.perf_counter() - begin
+            stats.nodes = len(search.nodes)
+
+            if search.reached and (best is None or search.cost < best.cost):
+                best = search.result()
+                if not finished:
+                    # Found by a shot before the heap reached its cost, so only the bound of the last finished
+                    # iteration holds, as the path is cheaper than its one
+                    best = replace(best, weight=weights[i - 1] if i > 0 else np.inf)
+                if on_path is not None:
+                    on_path(best)
+            # Out of time, or no path exists
+            if not finished or not search.reached:
+                break
+
+        if best is not None or not finished:
+            break
+
+    return best if best is not None else search.result()
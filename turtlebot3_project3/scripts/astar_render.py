@@ -0,0 +1,125 @@
+"""Drawing of the explored edges and paths of the A* planners, shared by the script and the ROS node"""
+
+import queue
+import threading
+
+import numpy as np
+import cv2
+
+
+def edge_polylines(edges, lattice):
+    """
+    Sampled arcs of the edges of an astar_planner.EdgeBuffer, looked up in the motion lattice of the plan
+    lattice is a MotionLattice, or an astar_lattice.AdaptiveLattice for plans with adaptive action durations
+    Returns an int32 array of shape (edges, samples + 1, 2) of (x, y) points from the state each action starts from,
+    actions cut short by an obstacle, or shorter than the longest one, repeat their last sample in free space
+    """
+
+    rows = edges.edges()
+    levels = getattr(lattice, 'levels', [lattice])
+    n_actions = len(levels[0].action_set)
+    level_of = rows[:, 3].astype(np.int64) // n_actions
+    n_steps = max(level.arc.shape[1] for level in levels)
+    points = np.empty((len(rows), n_steps + 1, 2), dtype=np.int32)
+    for k, level in enumerate(levels):
+        selected = level_of == k
+        if selected.any():
+            points[selected] = _level_polylines(rows[selected], level, n_actions, n_steps)
+    return points
+
+
+def _level_polylines(rows, lattice, n_actions, n_steps):
+    """edge_polylines() of the edges of one lattice, padded to n_steps samples"""
+
+    x, y, theta = rows[:, 0:1], rows[:, 1:2], rows[:, 2]
+    actions = rows[:, 3].astype(np.int64) % n_actions
+    cost = rows[:, 4:5]
+
+    # Same heading bins as MotionLattice.heading_index()
+    headings = np.rint((theta + 180) / lattice.heading_resolution).astype(np.int64) % lattice.n_headings
+    dx, dy, arc = lattice.dx[headings, actions], lattice.dy[headings, actions], lattice.arc[actions]
+
+    # Action costs are the arc length of the last sample truncated to whole mm
+    n_samples = (arc < cost + 1).sum(axis=1)
+    steps = np.minimum(np.arange(n_steps), np.maximum(n_samples - 1, 0)[:, None])
+    index = np.arange(len(rows))[:, None]
+    xs = np.where(n_samples[:, None] > 0, x + dx[index, steps], x)
+    ys = np.where(n_samples[:, None] > 0, y + dy[index, steps], y)
+
+    points = np.stack([np.concatenate([x, xs], axis=1), np.concatenate([y, ys], axis=1)], axis=2)
+    return np.rint(points).astype(np.int32)
+
+
+class Renderer:
+    """
+    Draws the map, edges and paths directly on a frame scale times smaller than the canvas, for display and video
+    Positions stay in canvas coordinates, they are scaled with sub pixel precision when drawn
+    """
+
+    # Fractional bits of the scaled points, see the shift argument of the OpenCV drawing functions
+    SHIFT = 4
+
+    def __init__(self, canvas, scale=5):
+        self.scale = scale
+        height, width = canvas.shape[:2]
+        # Downscale the map once, INTER_AREA keeps thin walls visible
+        self.frame = cv2.resize(canvas, (int(width/scale), int(height/scale)), interpolation=cv2.INTER_AREA)
+
+    def _points(self, points):
+        return np.rint(np.asarray(points, dtype=np.float64) * (1 << self.SHIFT) / self.scale).astype(np.int32)
+
+    def _thickness(self, thickness):
+        return max(1, int(round(thickness / self.scale)))
+
+    def edges(self, polylines, color=(254, 0, 0), thickness=5):
+        """Draw sampled arcs from edge_polylines()"""
+        cv2.polylines(self.frame, list(self._points(polylines)), False, color, self._thickness(thickness),
+                      cv2.LINE_8, self.SHIFT)
+
+    def path(self, path, color=(0, 0, 255), thickness=10):
+        """Draw the (x, y, ...) points of a path as connected lines"""
+        points = self._points([point[:2] for point in path])
+        cv2.polylines(self.frame, [points], False, color, self._thickness(thickness), cv2.LINE_8, self.SHIFT)
+
+    def circle(self, center, radius, color, thickness):
+        """Draw a circle given in canvas coordinates"""
+        cv2.circle(self.frame, tuple(self._points(center).tolist()), int(round(radius * (1 << self.SHIFT) / self.scale)),
+                   color, self._thickness(thickness), cv2.LINE_8, self.SHIFT)
+
+
+class VideoEncoder:
+    """
+    Writes frames to a video file from a background thread, so drawing does not wait for the encoder
+    write() queues a copy of the frame, close() waits for the queued frames to be written
+    """
+
+    def __init__(self, path, fps, size, fourcc='mp4v', queue_size=32):
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        # A bounded queue makes the drawing wait rather than holding every frame in memory
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._encode, daemon=True)
+        self.thread.start()
+
+    def _encode(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            self.writer.write(frame)
+
+    def write(self, frame, repeat=1):
+        """Queue a frame, repeat times"""
+        frame = frame.copy()
+        for _ in range(repeat):
+            self.frames.put(frame)
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        self.writer.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()